@@ -0,0 +1,332 @@
+"""Benchmark for report.py against a local Postgres loaded with synthetic FCI data.
+
+Creates the tables the report reads (fci_diaria_2, "clasesFCI", sociedades, efectos_*,
+report_aum_familia_2 and vista_rentabilidades) inside a dedicated schema, fills them at the
+requested scale (funds x business days) and times generate_multi_report_pdf end to end and
+each section's data fetch on its own.
+
+The database comes from the usual POSTGRES_* variables, or from a throwaway Docker
+container with --docker. Everything is created in --schema (default bench_fci), which is
+dropped and recreated on every load; nothing outside it is touched.
+
+    python benchmark_report.py --docker --funds 3000 --days 250 --repeat 3
+    python benchmark_report.py --skip-load --baseline bench_baseline.json --tolerance 0.2
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import subprocess
+import tempfile
+from datetime import date, datetime, timedelta
+from statistics import median
+from sqlalchemy import create_engine, text
+
+import report
+
+DOCKER_CONTAINER = "reporte-fci-bench"
+DOCKER_PORT = 55432
+
+CATEGORIAS = ["Money Market", "Renta Fija", "Renta Variable", "Renta Mixta",
+              "Infraestructura", "PyMEs", "Retorno Total", "Renta Fija Dólar"]
+
+SCHEMA_DDL = """
+    CREATE TABLE sociedades (
+        "sociedadGerente" text PRIMARY KEY,
+        gerente text
+    );
+    CREATE TABLE "clasesFCI" (
+        fondo text,
+        familia text,
+        categoria text,
+        "subCategoria" text,
+        desde date,
+        hasta date
+    );
+    CREATE TABLE fci_diaria_2 (
+        fecha_imputada date,
+        fondo text,
+        "sociedadGerente" text,
+        patrimonio numeric,
+        PRIMARY KEY (fecha_imputada, fondo)
+    );
+    CREATE TABLE efectos_intertemp_pesos (
+        fecha_imputada date,
+        fondo text,
+        es_1d numeric, es_1w numeric, es_mtd numeric, es_1m numeric,
+        es_3m numeric, es_ytd numeric, es_1y numeric,
+        PRIMARY KEY (fecha_imputada, fondo)
+    );
+    CREATE TABLE efectos_intertemp (LIKE efectos_intertemp_pesos INCLUDING ALL);
+    CREATE TABLE efectos_base_pesos (
+        fecha_imputada date,
+        fondo text,
+        es_1d numeric,
+        PRIMARY KEY (fecha_imputada, fondo)
+    );
+    CREATE TABLE efectos_base (LIKE efectos_base_pesos INCLUDING ALL);
+    CREATE TABLE report_aum_familia_2 (
+        fecha_imputada date,
+        familia text,
+        patrimonio numeric
+    );
+    CREATE INDEX ON report_aum_familia_2 (fecha_imputada);
+    CREATE TABLE rentabilidades_bench (
+        fecha_imputada date,
+        fondo text,
+        rent_vcp_1d numeric, rent_vcp_wtd numeric, rent_vcp_mtd numeric, rent_vcp_1m numeric,
+        rent_vcp_3m numeric, rent_vcp_ytd numeric, rent_vcp_1y numeric,
+        PRIMARY KEY (fecha_imputada, fondo)
+    );
+    CREATE VIEW vista_rentabilidades AS
+        SELECT r.fecha_imputada, r.fondo, f.patrimonio, c.categoria, c."subCategoria",
+               r.rent_vcp_1d, r.rent_vcp_wtd, r.rent_vcp_mtd, r.rent_vcp_1m,
+               r.rent_vcp_3m, r.rent_vcp_ytd, r.rent_vcp_1y
+        FROM rentabilidades_bench r
+        JOIN fci_diaria_2 f ON f.fecha_imputada = r.fecha_imputada AND f.fondo = r.fondo
+        LEFT JOIN "clasesFCI" c ON c.fondo = r.fondo
+            AND r.fecha_imputada BETWEEN c.desde AND COALESCE(c.hasta, CURRENT_DATE);
+"""
+
+# Every statement runs with :funds, :gerentes, :date_from and :date_to bound
+DATA_STATEMENTS = [
+    """
+    INSERT INTO sociedades
+    SELECT 'SG' || g, 'Gerente ' || g FROM generate_series(1, :gerentes) g
+    """,
+    # One fund in 50 is left without classification
+    """
+    INSERT INTO "clasesFCI"
+    SELECT 'Fondo ' || f, 'Familia ' || (f % 200),
+           (CAST(:categorias AS text[]))[1 + f % 8], 'Sub ' || (f % 30),
+           DATE '2000-01-01', NULL
+    FROM generate_series(1, :funds) f
+    WHERE f % 50 <> 0
+    """,
+    """
+    INSERT INTO fci_diaria_2
+    SELECT d::date, 'Fondo ' || f, 'SG' || (1 + f % :gerentes), round((random() * 1e12)::numeric, 2)
+    FROM generate_series(CAST(:date_from AS date), CAST(:date_to AS date), interval '1 day') d,
+         generate_series(1, :funds) f
+    WHERE extract(isodow FROM d) < 6
+    """,
+    """
+    INSERT INTO efectos_intertemp_pesos
+    SELECT fecha_imputada, fondo,
+           round(((random() - 0.5) * 1e10)::numeric, 2), round(((random() - 0.5) * 3e10)::numeric, 2),
+           round(((random() - 0.5) * 5e10)::numeric, 2), round(((random() - 0.5) * 6e10)::numeric, 2),
+           round(((random() - 0.5) * 1e11)::numeric, 2), round(((random() - 0.5) * 2e11)::numeric, 2),
+           round(((random() - 0.5) * 4e11)::numeric, 2)
+    FROM fci_diaria_2
+    """,
+    """
+    INSERT INTO efectos_intertemp
+    SELECT fecha_imputada, fondo, es_1d * 0.9, es_1w * 0.9, es_mtd * 0.9, es_1m * 0.9,
+           es_3m * 0.9, es_ytd * 0.9, es_1y * 0.9
+    FROM efectos_intertemp_pesos
+    """,
+    """
+    INSERT INTO efectos_base_pesos SELECT fecha_imputada, fondo, es_1d FROM efectos_intertemp_pesos
+    """,
+    """
+    INSERT INTO efectos_base SELECT fecha_imputada, fondo, es_1d FROM efectos_intertemp
+    """,
+    """
+    INSERT INTO report_aum_familia_2
+    SELECT f.fecha_imputada, c.familia, SUM(f.patrimonio)
+    FROM fci_diaria_2 f
+    JOIN "clasesFCI" c ON c.fondo = f.fondo
+    GROUP BY f.fecha_imputada, c.familia
+    """,
+    """
+    INSERT INTO rentabilidades_bench
+    SELECT fecha_imputada, fondo,
+           (random() - 0.5) / 100, (random() - 0.5) / 50, (random() - 0.5) / 20, (random() - 0.5) / 20,
+           (random() - 0.5) / 5, (random() - 0.5) / 2, random() - 0.3
+    FROM fci_diaria_2
+    """,
+]
+
+def business_days_back(end, days):
+    """First date of a window of `days` business days ending at end."""
+    current, count = end, 0
+    while True:
+        if current.weekday() < 5:
+            count += 1
+            if count >= days:
+                return current
+        current -= timedelta(days=1)
+
+def start_docker():
+    """Starts a disposable Postgres container and points the POSTGRES_* variables at it."""
+    subprocess.run(["docker", "rm", "-f", DOCKER_CONTAINER], capture_output=True)
+    subprocess.run([
+        "docker", "run", "--rm", "-d", "--name", DOCKER_CONTAINER,
+        "-e", "POSTGRES_USER=bench", "-e", "POSTGRES_PASSWORD=bench", "-e", "POSTGRES_DB=bench",
+        "-p", f"{DOCKER_PORT}:5432", "postgres:16",
+    ], check=True, capture_output=True)
+    os.environ.update({
+        "POSTGRES_USER": "bench", "POSTGRES_PASSWORD": "bench", "POSTGRES_HOST": "localhost",
+        "POSTGRES_PORT": str(DOCKER_PORT), "POSTGRES_DB": "bench",
+    })
+
+def stop_docker():
+    subprocess.run(["docker", "rm", "-f", DOCKER_CONTAINER], capture_output=True)
+
+def database_url():
+    return (f"postgresql://{os.environ.get('POSTGRES_USER')}:{os.environ.get('POSTGRES_PASSWORD')}"
+            f"@{os.environ.get('POSTGRES_HOST')}:{os.environ.get('POSTGRES_PORT', '5432')}/{os.environ.get('POSTGRES_DB')}")
+
+def make_engine(schema, timeout=60):
+    """Engine whose connections only see the benchmark schema, waiting for the server to come up."""
+    engine = create_engine(database_url(), connect_args={"options": f"-csearch_path={schema}"})
+    deadline = time.monotonic() + timeout
+    while True:
+        try:
+            with engine.connect() as connection:
+                connection.execute(text("SELECT 1"))
+            return engine
+        except Exception:
+            if time.monotonic() > deadline:
+                raise
+            time.sleep(1)
+
+def load_data(engine, schema, funds, days, gerentes, end_date):
+    """Recreates the benchmark schema and fills it with synthetic data."""
+    date_from = business_days_back(end_date, days)
+    params = {
+        "funds": funds, "gerentes": gerentes, "categorias": CATEGORIAS,
+        "date_from": date_from.isoformat(), "date_to": end_date.isoformat(),
+    }
+    print(f"Loading {funds} funds x {days} business days ({date_from} to {end_date}) into schema {schema}")
+    with engine.begin() as connection:
+        connection.execute(text(f'DROP SCHEMA IF EXISTS "{schema}" CASCADE'))
+        connection.execute(text(f'CREATE SCHEMA "{schema}"'))
+        for statement in SCHEMA_DDL.split(";"):
+            if statement.strip():
+                connection.execute(text(statement))
+        for statement in DATA_STATEMENTS:
+            start = time.perf_counter()
+            connection.execute(text(statement), params)
+            print(f"  {statement.split()[2]:<28} {time.perf_counter() - start:7.2f}s")
+    with engine.connect() as connection:
+        connection.execution_options(isolation_level="AUTOCOMMIT")
+        connection.execute(text("ANALYZE"))
+
+def time_fetchers(report_date, repeat):
+    """Times each section's data fetcher on its own, sequentially, without the result cache."""
+    fetchers = []
+    for fetch, _ in report.SECTION_FETCHERS.values():
+        if fetch not in fetchers:
+            fetchers.append(fetch)
+    timings = {}
+    for fetch in fetchers:
+        samples = []
+        for _ in range(repeat):
+            metrics = report.RunMetrics(report_date)
+            report._run_fetcher(fetch, [report_date], metrics)
+            samples.append(metrics.records()[0])
+        name = samples[0]["fetcher"]
+        timings[name] = {
+            "fetch_s": median(sample["fetch_s"] for sample in samples),
+            "rows": samples[0].get("rows", 0),
+            "bytes": samples[0].get("bytes", 0),
+        }
+        print(f"  fetch {name:<24} {timings[name]['fetch_s']:7.3f}s  {timings[name]['rows']:>8} rows")
+    return timings
+
+def time_report(report_date, repeat):
+    """Times generate_multi_report_pdf end to end, returning the median run and its sections."""
+    runs = []
+    with tempfile.TemporaryDirectory(prefix="reporte_fci_bench_") as out_dir:
+        output_file = os.path.join(out_dir, report.report_filename(report_date))
+        for i in range(repeat):
+            if not report.generate_multi_report_pdf(output_file, report.DEFAULT_SUB_REPORTS, report_date):
+                raise RuntimeError("Report generation failed")
+            with open(report.metrics_filename(output_file)) as file:
+                records = [json.loads(line) for line in file]
+            run = next(r for r in records if r["event"] == "run")
+            sections = {r["section"]: r for r in records if r["event"] == "section"}
+            runs.append((run["total_s"], run, sections))
+            print(f"  run {i + 1}: {run['total_s']:.3f}s (fetch {run.get('fetch_s', 0):.3f}s, "
+                  f"build {run.get('build_s', 0):.3f}s, {run.get('pages')} pages)")
+    runs.sort(key=lambda r: r[0])
+    _, run, sections = runs[len(runs) // 2]
+    return {
+        "total_s": run["total_s"], "fetch_s": run.get("fetch_s"), "build_s": run.get("build_s"),
+        "pages": run.get("pages"),
+        "sections": {name: {k: v for k, v in values.items() if k.endswith("_s")} for name, values in sections.items()},
+    }
+
+def compare_with_baseline(results, baseline_file, tolerance):
+    """Returns False if the end-to-end time regressed beyond tolerance vs the baseline."""
+    with open(baseline_file) as file:
+        baseline = json.load(file)
+    current, previous = results["report"]["total_s"], baseline["report"]["total_s"]
+    change = (current - previous) / previous if previous else 0
+    print(f"Baseline: {previous:.3f}s, now {current:.3f}s ({change:+.1%})")
+    for name, values in results["fetchers"].items():
+        before = baseline.get("fetchers", {}).get(name, {}).get("fetch_s")
+        if before:
+            print(f"  fetch {name:<24} {before:7.3f}s -> {values['fetch_s']:7.3f}s")
+    if change > tolerance:
+        print(f"Regression: end-to-end time grew more than {tolerance:.0%}")
+        return False
+    return True
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark de report.py con datos sintéticos en un Postgres local.")
+    parser.add_argument("--docker", action="store_true", help="Levantar un Postgres descartable en Docker.")
+    parser.add_argument("--keep", action="store_true", help="No detener el contenedor Docker al terminar.")
+    parser.add_argument("--schema", default="bench_fci", help="Schema donde se crean los datos (se borra y recrea).")
+    parser.add_argument("--funds", type=int, default=3000, help="Cantidad de fondos.")
+    parser.add_argument("--days", type=int, default=250, help="Días hábiles de historia.")
+    parser.add_argument("--gerentes", type=int, default=60, help="Cantidad de sociedades gerentes.")
+    parser.add_argument("--end-date", default=date.today().isoformat(), help="Última fecha de datos (YYYY-MM-DD).")
+    parser.add_argument("--skip-load", action="store_true", help="Reusar los datos ya cargados en el schema.")
+    parser.add_argument("--repeat", type=int, default=3, help="Repeticiones de cada medición (se informa la mediana).")
+    parser.add_argument("--output", default="bench_results.json", help="Archivo JSON con los resultados.")
+    parser.add_argument("--baseline", help="Resultados previos contra los que comparar.")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="Regresión admitida en el tiempo total (0.2 = 20%%).")
+    return parser.parse_args(argv)
+
+def main(argv=None):
+    args = parse_args(argv)
+    if args.docker:
+        start_docker()
+    try:
+        engine = make_engine(args.schema)
+        if not args.skip_load:
+            end_date = datetime.strptime(args.end_date, '%Y-%m-%d').date()
+            load_data(engine, args.schema, args.funds, args.days, args.gerentes, end_date)
+
+        # Point the report at the benchmark schema and measure it cold, without the result cache
+        report._engine = engine
+        report.CACHE_ENABLED = False
+        # Derived tables as the nightly procedure run leaves them
+        report.refresh_known_funds()
+        report.refresh_daily_totals()
+        report_date = report.get_report_date()
+
+        print(f"Fetchers (median of {args.repeat}):")
+        fetchers = time_fetchers(report_date, args.repeat)
+        print(f"End to end (median of {args.repeat}):")
+        results = {
+            "report_date": report_date,
+            "scale": {"funds": args.funds, "days": args.days, "gerentes": args.gerentes},
+            "fetchers": fetchers,
+            "report": time_report(report_date, args.repeat),
+        }
+        with open(args.output, "w") as file:
+            json.dump(results, file, indent=2)
+        print(f"Results written to {args.output}")
+
+        if args.baseline and not compare_with_baseline(results, args.baseline, args.tolerance):
+            sys.exit(1)
+    finally:
+        if args.docker and not args.keep:
+            stop_docker()
+
+if __name__ == "__main__":
+    main()
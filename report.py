@@ -1,17 +1,54 @@
+import time
+_STARTUP_T0 = time.perf_counter()
 import os
 import sys
 import re
+import argparse
+from contextlib import asynccontextmanager, contextmanager
 from sqlalchemy import create_engine, text
-from datetime import datetime
+from datetime import date, datetime, timedelta
+from decimal import Decimal
 from reportlab.lib.pagesizes import letter
 from reportlab.lib import colors
 from reportlab.lib.styles import ParagraphStyle, getSampleStyleSheet
 from reportlab.platypus import SimpleDocTemplate, Table, TableStyle, Spacer, Image, Paragraph, PageBreak
-from reportlab.pdfbase.ttfonts import TTFont
-from reportlab.pdfbase import pdfmetrics
-import matplotlib.pyplot as plt
+from reportlab.pdfgen.canvas import Canvas
+import io
+import csv
+import shutil
 import tempfile
-import time
+import hashlib
+import json
+import pickle
+import gzip
+import threading
+import asyncio
+import contextvars
+import uuid
+from collections import OrderedDict, namedtuple
+from functools import partial
+from types import SimpleNamespace
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, ThreadPoolExecutor, as_completed, wait
+
+# matplotlib, the TTF fonts and the database engine are loaded on first use (see below),
+# so quick invocations such as --print-date don't pay for them.
+STARTUP_TIMINGS = [("imports", time.perf_counter() - _STARTUP_T0)]
+
+@contextmanager
+def startup_phase(name):
+    """Records how long a one-time initialization step takes, for --startup-profile."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        STARTUP_TIMINGS.append((name, time.perf_counter() - start))
+
+def print_startup_profile():
+    """Prints import and initialization costs recorded so far."""
+    print("Startup profile (use python -X importtime for a per-module breakdown):", file=sys.stderr)
+    for name, seconds in STARTUP_TIMINGS:
+        print(f"  {name:<20} {seconds * 1000:8.1f} ms", file=sys.stderr)
+    print(f"  {'total':<20} {(time.perf_counter() - _STARTUP_T0) * 1000:8.1f} ms", file=sys.stderr)
 
 # Load environment variables
 db_user = os.environ.get('POSTGRES_USER')
@@ -21,12 +58,747 @@ db_port = os.environ.get('POSTGRES_PORT', '5432')
 db_name = os.environ.get('POSTGRES_DB')
 DATABASE_URL = f"postgresql://{db_user}:{db_password}@{db_host}:{db_port}/{db_name}"
 
-# Register fonts
-pdfmetrics.registerFont(TTFont("MS Sans Serif", "./Microsoft Sans Serif.ttf"))
-pdfmetrics.registerFont(TTFont("MS Sans Serif Bold", "./MS Sans Serif Bold.ttf"))
+# Async data layer (opt-in): section queries, date lookup and procedures on one event loop
+ASYNC_DB = os.environ.get('REPORT_ASYNC_DB', '0') == '1'
+ASYNC_DRIVER = os.environ.get('REPORT_ASYNC_DRIVER', 'asyncpg')
+ASYNC_DATABASE_URL = f"postgresql+{ASYNC_DRIVER}://{db_user}:{db_password}@{db_host}:{db_port}/{db_name}"
+
+# Report fonts, as (reportlab name, TTF file)
+FONT_FILES = (
+    ("MS Sans Serif", "./Microsoft Sans Serif.ttf"),
+    ("MS Sans Serif Bold", "./MS Sans Serif Bold.ttf"),
+)
+
+_init_lock = threading.Lock()
+_fonts_registered = False
+_engine = None
+_async_engine = None
+_event_loop = None
+
+def register_fonts():
+    """Registers the report fonts with reportlab, once per process."""
+    global _fonts_registered
+    with _init_lock:
+        if _fonts_registered:
+            return
+        with startup_phase("register_fonts"):
+            from reportlab.pdfbase import pdfmetrics
+            for font_name, filename in FONT_FILES:
+                pdfmetrics.registerFont(_load_ttfont(font_name, filename))
+        _fonts_registered = True
+
+def _ttf_pdf_scale(units_per_em):
+    """Glyph unit scaling set by reportlab's TTF parser (a lambda, so it can't be pickled)."""
+    if units_per_em == 1000:
+        return lambda x: x
+    factor = 1000 / units_per_em
+    return lambda x: x * factor
+
+def _load_ttfont(font_name, filename):
+    """Returns a TTFont for filename, reusing a pre-parsed copy from CACHE_DIR when possible.
+
+    The cached copy is keyed by the font file's hash and the reportlab version, so editing
+    the file or upgrading reportlab parses it again.
+    """
+    import reportlab
+    from weakref import WeakKeyDictionary
+    from reportlab.pdfbase.ttfonts import TTFont, TTFontFace
+
+    if not CACHE_ENABLED:
+        return TTFont(font_name, filename)
+
+    with open(filename, "rb") as file:
+        file_hash = hashlib.sha256(file.read()).hexdigest()
+    key = hashlib.sha256(f"{font_name}|{file_hash}|{reportlab.Version}".encode()).hexdigest()
+    path = os.path.join(CACHE_DIR, "fonts", f"{key}.pickle")
+
+    try:
+        with open(path, "rb") as file:
+            font_state, face_state = pickle.load(file)
+        face = TTFontFace.__new__(TTFontFace)
+        face.__dict__.update(face_state)
+        face._pdfScale = _ttf_pdf_scale(face.unitsPerEm)
+        font = TTFont.__new__(TTFont)
+        font.__dict__.update(font_state)
+        font.face = face
+        font.state = WeakKeyDictionary()
+        return font
+    except FileNotFoundError:
+        pass
+    except Exception as e:
+        print(f"Fonts: discarding unreadable cache {path}: {str(e)}")
+
+    font = TTFont(font_name, filename)
+    try:
+        font_state = {k: v for k, v in vars(font).items() if k not in ("face", "state")}
+        face_state = {k: v for k, v in vars(font.face).items() if k != "_pdfScale"}
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, "wb") as file:
+            pickle.dump((font_state, face_state), file, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path, path)
+    except Exception as e:
+        print(f"Fonts: could not cache parsed font {filename}: {str(e)}")
+    return font
+
+def get_engine():
+    """Database engine, created on first use and shared for the rest of the process."""
+    global _engine
+    with _init_lock:
+        if _engine is None:
+            with startup_phase("create_engine"):
+                _engine = create_engine(DATABASE_URL, pool_size=DB_POOL_SIZE, max_overflow=DB_MAX_OVERFLOW)
+        return _engine
+
+def async_db_available():
+    """True if the async engine can be used: SQLAlchemy's asyncio support and the driver."""
+    import importlib.util
+    return all(importlib.util.find_spec(module) for module in ("greenlet", ASYNC_DRIVER))
+
+def get_async_engine():
+    """Async engine over ASYNC_DRIVER, created on first use on the report's event loop."""
+    global _async_engine
+    with _init_lock:
+        if _async_engine is None:
+            from sqlalchemy.ext.asyncio import create_async_engine
+            with startup_phase("create_async_engine"):
+                _async_engine = create_async_engine(ASYNC_DATABASE_URL, pool_size=DB_POOL_SIZE,
+                                                    max_overflow=DB_MAX_OVERFLOW)
+        return _async_engine
+
+def run_async(coro):
+    """Runs coro on the report's event loop and returns its result.
+
+    The loop lives in a daemon thread started on first use, so the async engine and its
+    pooled connections stay bound to one loop for the whole process, whichever thread
+    calls in (CLI, batch or report server).
+    """
+    global _event_loop
+    with _init_lock:
+        if _event_loop is None:
+            _event_loop = asyncio.new_event_loop()
+            threading.Thread(target=_event_loop.run_forever, name="report-asyncio", daemon=True).start()
+    return asyncio.run_coroutine_threadsafe(coro, _event_loop).result()
+
+def load_pyplot():
+    """Imports matplotlib.pyplot on first use; it is by far the slowest import of the report."""
+    if "matplotlib.pyplot" not in sys.modules:
+        with startup_phase("import_matplotlib"):
+            import matplotlib.pyplot
+    return sys.modules["matplotlib.pyplot"]
+
+def __getattr__(name):
+    # Keeps report.engine working for callers now that the engine is created lazily
+    if name == "engine":
+        return get_engine()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+# Max number of section queries in flight at once (stays within the engine pool)
+FETCH_WORKERS = int(os.environ.get('REPORT_FETCH_WORKERS', '6'))
+
+# Engine connection pool (SQLAlchemy's defaults); the report server raises the pool size
+# to fit the requests it fetches for at once
+DB_POOL_SIZE = int(os.environ.get('REPORT_DB_POOL_SIZE', '5'))
+DB_MAX_OVERFLOW = int(os.environ.get('REPORT_DB_MAX_OVERFLOW', '10'))
+
+# Max number of stored procedures running at once, each on its own connection
+PROCEDURE_WORKERS = int(os.environ.get('REPORT_PROCEDURE_WORKERS', '4'))
+
+# Days before their last folded-in date the report's own tables re-check for corrections;
+# older dates are only re-read by a full refresh (REPORT_REFRESH_DAYS=-1)
+REFRESH_WINDOW_DAYS = int(os.environ.get('REPORT_REFRESH_DAYS', '31'))
+
+# Section query result cache: in-memory LRU in front of an on-disk store
+CACHE_ENABLED = os.environ.get('REPORT_CACHE', '1') != '0'
+CACHE_DIR = os.environ.get('REPORT_CACHE_DIR', os.path.join(os.path.expanduser('~'), '.cache', 'reporte_fci'))
+CACHE_MEMORY_ITEMS = int(os.environ.get('REPORT_CACHE_MEMORY_ITEMS', '64'))
+CACHE_MAX_BYTES = int(os.environ.get('REPORT_CACHE_MAX_MB', '256')) * 1024 * 1024
+
+# Run every section query of a report against one exported REPEATABLE READ snapshot
+SNAPSHOT_ENABLED = os.environ.get('REPORT_SNAPSHOT', '1') != '0'
+
+# Per-section PDF fragments, reused while a section's data and the layout code are unchanged
+FRAGMENTS_ENABLED = os.environ.get('REPORT_FRAGMENTS', '1') != '0'
+FRAGMENT_DIR = os.path.join(CACHE_DIR, 'fragments')
+# A run's private fragment directory left this long (by a crashed or killed run) is removed
+STALE_RUN_SECONDS = 6 * 3600
+
+# Processes laying out fragments in parallel (1 = lay them out in this process)
+RENDER_WORKERS = int(os.environ.get('REPORT_RENDER_WORKERS', '1'))
+
+# Rows per chunk when storing, formatting and exporting large results (one row per fund)
+CHUNK_ROWS = int(os.environ.get('REPORT_CHUNK_ROWS', '2000'))
+
+# Dataset formats written next to the PDF from the fetched section data (csv, xlsx, parquet)
+EXPORT_FORMATS = [f.strip() for f in os.environ.get('REPORT_EXPORT', '').split(',') if f.strip()]
+
+_memory_cache = OrderedDict()
+_cache_lock = threading.Lock()
+# Cache watermarks come from a change log: a statement-level trigger on every source table
+# records, inside the writing transaction itself, each transaction that inserts, updates,
+# deletes or truncates it into report_cambios. Counted in a run's snapshot, a table's
+# entries change exactly when the data that snapshot sees does. Tables without the trigger
+# (see install_change_log) are never cached.
+CHANGE_LOG_TRIGGER = "report_cambios"
+
+def _change_log_ddl(schema):
+    """Log table and trigger function, qualified so writers with any search_path reach them."""
+    return (
+        text(f"""
+            CREATE TABLE IF NOT EXISTS {schema}.report_cambios (
+                tabla text NOT NULL,
+                transaccion bigint NOT NULL,
+                registrado timestamptz NOT NULL DEFAULT now(),
+                PRIMARY KEY (tabla, transaccion)
+            )
+        """),
+        text(f"""
+            CREATE OR REPLACE FUNCTION {schema}.report_registrar_cambio() RETURNS trigger
+            LANGUAGE plpgsql SECURITY DEFINER AS $$
+            BEGIN
+                INSERT INTO {schema}.report_cambios (tabla, transaccion)
+                VALUES (TG_TABLE_NAME, txid_current())
+                ON CONFLICT DO NOTHING;
+                RETURN NULL;
+            END
+            $$
+        """),
+    )
+
+# Plain views are expanded to the tables behind them; materialized views change on
+# REFRESH, which no trigger sees, so they are left out and never cached
+VIEW_TABLES_QUERY = text("""
+    SELECT DISTINCT v.relname, t.relname
+    FROM pg_rewrite r
+    JOIN pg_class v ON v.oid = r.ev_class
+    JOIN pg_depend d ON d.classid = 'pg_rewrite'::regclass AND d.objid = r.oid
+        AND d.refclassid = 'pg_class'::regclass
+    JOIN pg_class t ON t.oid = d.refobjid
+    WHERE v.relkind = 'v' AND t.oid <> v.oid
+""")
+
+LOGGED_TABLES_QUERY = text(f"""
+    SELECT c.relname
+    FROM pg_trigger t
+    JOIN pg_class c ON c.oid = t.tgrelid
+    WHERE t.tgname = '{CHANGE_LOG_TRIGGER}'
+""")
+
+CHANGE_LOG_EXISTS_QUERY = text("SELECT to_regclass('report_cambios') IS NOT NULL")
+
+CHANGE_LOG_COUNTS_QUERY = text("SELECT tabla, COUNT(*) FROM report_cambios GROUP BY tabla")
+
+def read_change_log(connection):
+    """(tables, views) cache watermarks as seen by connection's transaction.
+
+    tables maps every table carrying the change log trigger to its number of logged
+    transactions; views maps each view to the tables it reads.
+    """
+    views = {}
+    for view, table in connection.execute(VIEW_TABLES_QUERY):
+        views.setdefault(view, set()).add(table)
+    if not connection.execute(CHANGE_LOG_EXISTS_QUERY).scalar():
+        return {}, views
+    logged = [name for name, in connection.execute(LOGGED_TABLES_QUERY)]
+    counts = dict(connection.execute(CHANGE_LOG_COUNTS_QUERY).all())
+    return {table: counts.get(table, 0) for table in logged}, views
+
+async def read_change_log_async(connection):
+    """read_change_log on an async connection."""
+    views = {}
+    for view, table in await connection.execute(VIEW_TABLES_QUERY):
+        views.setdefault(view, set()).add(table)
+    if not await connection.scalar(CHANGE_LOG_EXISTS_QUERY):
+        return {}, views
+    logged = [name for name, in await connection.execute(LOGGED_TABLES_QUERY)]
+    counts = dict((await connection.execute(CHANGE_LOG_COUNTS_QUERY)).all())
+    return {table: counts.get(table, 0) for table in logged}, views
+
+def _base_tables(sources, views):
+    """The tables behind sources, expanding views (and views on views)."""
+    pending, tables, seen = list(sources), set(), set()
+    while pending:
+        name = pending.pop()
+        if name in seen:
+            continue
+        seen.add(name)
+        if name in views:
+            pending.extend(views[name])
+        else:
+            tables.add(name)
+    return tables
+
+def source_watermark(sources, watermarks):
+    """Watermark of the tables a query reads, from (tables, views) as read_change_log returns.
+
+    Returns None if the watermarks are missing or a table behind sources has no change log,
+    i.e. the query cannot be cached.
+    """
+    if watermarks is None:
+        return None
+    tables, views = watermarks
+    base = _base_tables(sources, views)
+    if not base <= tables.keys():
+        return None
+    return tuple((name, tables[name]) for name in sorted(base))
+
+def install_change_log(sources=None):
+    """Creates report_cambios and its trigger on every table behind sources lacking it.
+
+    sources defaults to every table the report reads (CACHE_SOURCES). Creating a trigger
+    needs to own the table; tables where that fails, or that do not exist yet, stay
+    uncached. Returns the number of triggers created, or None if the log could not be set up.
+    """
+    sources = CACHE_SOURCES if sources is None else sources
+    created = 0
+    try:
+        with get_engine().begin() as connection:
+            schema = connection.execute(text("SELECT quote_ident(current_schema())")).scalar()
+            for statement in _change_log_ddl(schema):
+                connection.execute(statement)
+            tables, views = read_change_log(connection)
+            for table in sorted(_base_tables(sources, views) - tables.keys()):
+                relation = connection.execute(text("SELECT to_regclass(quote_ident(:table))::text"),
+                                              {"table": table}).scalar()
+                if relation is None:
+                    continue
+                try:
+                    with connection.begin_nested():
+                        connection.execute(text(
+                            f"CREATE TRIGGER {CHANGE_LOG_TRIGGER} "
+                            f"AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON {relation} "
+                            f"FOR EACH STATEMENT EXECUTE FUNCTION {schema}.report_registrar_cambio()"))
+                    created += 1
+                except Exception as e:
+                    print(f"Cache: no change log on {table}, it will not be cached: {str(e)}")
+    except Exception as e:
+        print(f"Cache: could not set up report_cambios: {str(e)}")
+        return None
+    if created:
+        print(f"Cache: change log installed on {created} tables")
+    return created
+
+def _cache_path(key):
+    return os.path.join(CACHE_DIR, f"{key}.cache")
+
+def _read_disk_cache(key):
+    """Loads a cached result from disk, or None on a miss."""
+    path = _cache_path(key)
+    try:
+        with gzip.open(path, "rb") as file:
+            n_rows, rows = pickle.load(file), []
+            while len(rows) < n_rows:
+                size, columns = pickle.load(file)
+                rows.extend(zip(*columns) if columns else [()] * size)
+        os.utime(path)  # Eviction drops the least recently used files first
+    except FileNotFoundError:
+        return None
+    except Exception as e:
+        print(f"Cache: discarding unreadable entry {path}: {str(e)}")
+        return None
+    return rows
+
+def _write_disk_cache(key, rows):
+    """Stores a result on disk, then evicts old entries over the size limit.
+
+    Rows are written column by column in chunks of REPORT_CHUNK_ROWS through a
+    compressed stream, so no second copy of a large result is built to store it.
+    """
+    try:
+        os.makedirs(CACHE_DIR, exist_ok=True)
+        tmp_path = f"{_cache_path(key)}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with gzip.open(tmp_path, "wb", compresslevel=6) as file:
+            pickle.dump(len(rows), file, protocol=pickle.HIGHEST_PROTOCOL)
+            for start in range(0, len(rows), CHUNK_ROWS):
+                chunk = rows[start:start + CHUNK_ROWS]
+                pickle.dump((len(chunk), list(zip(*chunk))), file, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path, _cache_path(key))
+        _evict_disk_cache()
+    except Exception as e:
+        print(f"Cache: could not write entry: {str(e)}")
+
+def _evict_disk_cache(directory=CACHE_DIR, suffix=".cache"):
+    """Removes the least recently used files in directory until they fit in REPORT_CACHE_MAX_MB.
+
+    Other processes share the directory, so files may vanish while it is scanned.
+    """
+    entries = []
+    try:
+        with os.scandir(directory) as it:
+            for entry in it:
+                if entry.name.endswith(suffix):
+                    try:
+                        stat = entry.stat()
+                    except FileNotFoundError:
+                        continue
+                    entries.append((stat.st_mtime, stat.st_size, entry.path))
+    except FileNotFoundError:
+        return
+    total = sum(size for _, size, _ in entries)
+    for _, size, path in sorted(entries):
+        if total <= CACHE_MAX_BYTES:
+            break
+        try:
+            os.remove(path)
+            total -= size
+        except FileNotFoundError:
+            pass
+
+class RunSnapshot:
+    """One consistent database snapshot shared by every query of a report run.
+
+    A leader connection opens a REPEATABLE READ transaction and exports its snapshot, then
+    serves the first fetcher; each other concurrent fetcher gets a connection (reused for
+    all its queries) whose transaction imports the snapshot, so categoria, subcategoria, gerente and the other sections
+    all see the same committed state even if procedures write mid-run. Connections are
+    opened on first use and released by close().
+
+    The cache watermarks are read once, from the change log as the snapshot sees it, and
+    used for every lookup of the run: a key always names exactly the data the run reads.
+    """
+
+    def __init__(self, engine=None):
+        self.engine = engine
+        self.snapshot_id = None
+        self._watermarks = None
+        self._leader = None
+        self._idle = []
+        self._opened = []
+        self._lock = threading.Lock()
+
+    def watermarks(self):
+        """The run's (tables, views) cache watermarks (see read_change_log), None if unknown."""
+        with self._lock:
+            self._start()
+        return self._watermarks
+
+    def _start(self):
+        """Opens the leader, exports its snapshot and reads the watermarks in it (under _lock)."""
+        if self._leader is not None:
+            return
+        self._leader = self._begin()
+        try:
+            self.snapshot_id = self._leader.exec_driver_sql("SELECT pg_export_snapshot()").scalar()
+        except Exception as e:
+            print(f"Snapshot: could not export a snapshot, sections may see different states: {str(e)}")
+            return
+        try:
+            with self._leader.begin_nested():
+                self._watermarks = read_change_log(self._leader)
+        except Exception as e:
+            print(f"Cache: could not read the change log, not caching this run: {str(e)}")
+        self._idle.append(self._leader)
+
+    def _begin(self):
+        connection = (self.engine or get_engine()).connect()
+        connection = connection.execution_options(isolation_level="REPEATABLE READ")
+        self._opened.append(connection)
+        return connection
+
+    @contextmanager
+    def connection(self):
+        with self._lock:
+            self._start()
+            if self.snapshot_id is None:
+                connection = None
+            elif self._idle:
+                connection = self._idle.pop()
+            else:
+                connection = self._begin()
+                connection.exec_driver_sql(f"SET TRANSACTION SNAPSHOT '{self.snapshot_id}'")
+        if connection is None:
+            with (self.engine or get_engine()).connect() as connection:
+                yield connection
+            return
+        try:
+            yield connection
+        except Exception:
+            # A failed statement aborts that transaction: drop the connection, keep the
+            # snapshot (the leader's open transaction, so it stays open until close())
+            if connection is not self._leader:
+                self._discard(connection)
+            raise
+        with self._lock:
+            self._idle.append(connection)
+
+    def _discard(self, connection):
+        try:
+            connection.rollback()
+            connection.close()
+        except Exception:
+            pass
+
+    def close(self):
+        """Ends every transaction of the run (read-only, so they are rolled back)."""
+        for connection in self._opened:
+            self._discard(connection)
+        self._opened, self._idle, self._leader = [], [], None
+
+class AsyncRunSnapshot(RunSnapshot):
+    """RunSnapshot over the async engine, for fetch_sections_range_async."""
+
+    def __init__(self):
+        super().__init__()
+        self._leader_lock = asyncio.Lock()
+
+    async def _begin_async(self):
+        connection = await get_async_engine().connect()
+        connection = await connection.execution_options(isolation_level="REPEATABLE READ")
+        self._opened.append(connection)
+        return connection
+
+    async def watermarks_async(self):
+        """RunSnapshot.watermarks, read on the async leader."""
+        await self._start_async()
+        return self._watermarks
+
+    async def _start_async(self):
+        # Tasks share one loop, so only the leader's creation needs guarding
+        async with self._leader_lock:
+            if self._leader is not None:
+                return
+            self._leader = await self._begin_async()
+            try:
+                self.snapshot_id = await self._leader.scalar(text("SELECT pg_export_snapshot()"))
+            except Exception as e:
+                print(f"Snapshot: could not export a snapshot, sections may see different states: {str(e)}")
+                return
+            try:
+                async with self._leader.begin_nested():
+                    self._watermarks = await read_change_log_async(self._leader)
+            except Exception as e:
+                print(f"Cache: could not read the change log, not caching this run: {str(e)}")
+            self._idle.append(self._leader)
+
+    @asynccontextmanager
+    async def connection(self):
+        await self._start_async()
+        if self.snapshot_id is None:
+            async with get_async_engine().connect() as connection:
+                yield connection
+            return
+        if self._idle:
+            connection = self._idle.pop()
+        else:
+            connection = await self._begin_async()
+            await connection.exec_driver_sql(f"SET TRANSACTION SNAPSHOT '{self.snapshot_id}'")
+        try:
+            yield connection
+        except Exception:
+            if connection is not self._leader:
+                await self._discard(connection)
+            raise
+        self._idle.append(connection)
+
+    async def _discard(self, connection):
+        try:
+            await connection.rollback()
+            await connection.close()
+        except Exception:
+            pass
+
+    async def close(self):
+        for connection in self._opened:
+            await self._discard(connection)
+        self._opened, self._idle, self._leader = [], [], None
+
+# Snapshot of the report run the current fetcher belongs to (see fetch_sections_range)
+_run_snapshot = contextvars.ContextVar("report_run_snapshot", default=None)
+
+@contextmanager
+def bind_snapshot(snapshot):
+    token = _run_snapshot.set(snapshot)
+    try:
+        yield
+    finally:
+        _run_snapshot.reset(token)
+
+def _cache_key(query, params, sources, watermarks):
+    """Cache key of a section query under the run's watermarks, None if it cannot be cached.
+
+    Only runs with a snapshot are cached: their watermarks are read in the same snapshot
+    as their rows.
+    """
+    if not (CACHE_ENABLED and sources):
+        return None
+    watermark = source_watermark(sources, watermarks)
+    if watermark is None:
+        return None
+    return hashlib.sha256(repr((str(query), sorted(params.items()), watermark)).encode()).hexdigest()
+
+def _cache_get(key, in_memory=True):
+    """Cached rows for key, or None. With in_memory=False (see run_query) hits are only
+    read from disk and not kept in the in-memory cache.
+    """
+    if key is None:
+        return None
+    with _cache_lock:
+        rows = _memory_cache.get(key)
+        if rows is not None:
+            _memory_cache.move_to_end(key)
+    if rows is None:
+        rows = _read_disk_cache(key)
+        if rows is not None and in_memory:
+            _remember(key, rows)
+    if rows is not None:
+        metric_add(queries=1, cache_hits=1, rows=len(rows))
+    return rows
+
+def _cache_lookup(query, params, sources, in_memory=True):
+    """Returns (key, rows) for a section query: rows on a cache hit, key to store it otherwise."""
+    if not (CACHE_ENABLED and sources):
+        return None, None
+    snapshot = _run_snapshot.get()
+    key = _cache_key(query, params, sources, snapshot.watermarks() if snapshot else None)
+    return key, _cache_get(key, in_memory)
+
+async def _cache_lookup_async(query, params, sources, in_memory=True):
+    """_cache_lookup for the async fetchers: the watermarks are read on the async engine and
+    the disk cache in a thread, so neither blocks the event loop."""
+    if not (CACHE_ENABLED and sources):
+        return None, None
+    snapshot = _run_snapshot.get()
+    key = _cache_key(query, params, sources, await snapshot.watermarks_async() if snapshot else None)
+    if key is None:
+        return None, None
+    return key, await asyncio.to_thread(_cache_get, key, in_memory)
+
+def run_query(query, params=None, sources=(), in_memory=True):
+    """Executes a section query and returns its rows as tuples, going through the result cache.
+
+    Results are keyed by the statement, its parameters and the watermark of the tables in
+    sources, so a rerun for the same date only reaches Postgres when upstream data changed.
+    With in_memory=False (the largest results, one row per fund) they are cached on disk
+    only, so a long-lived process does not keep them in memory between runs.
+    """
+    params = params or {}
+    key, rows = _cache_lookup(query, params, sources, in_memory)
+    if rows is not None:
+        return rows
+
+    start = time.perf_counter()
+    snapshot = _run_snapshot.get()
+    with snapshot.connection() if snapshot else get_engine().connect() as connection:
+        rows = [tuple(row) for row in connection.execute(query, params)]
+    metric_add(queries=1, query_s=time.perf_counter() - start, rows=len(rows), bytes=_text_bytes(rows))
+
+    if key is not None:
+        if in_memory:
+            _remember(key, rows)
+        _write_disk_cache(key, rows)
+    return rows
+
+async def run_query_async(query, params=None, sources=(), in_memory=True):
+    """run_query over the async engine, awaited on the report's event loop.
+
+    The cache is shared with run_query; the watermarks are read on the async leader, once
+    per run snapshot, and disk entries are read and written in a thread.
+    """
+    params = params or {}
+    key, rows = await _cache_lookup_async(query, params, sources, in_memory)
+    if rows is not None:
+        return rows
+
+    start = time.perf_counter()
+    snapshot = _run_snapshot.get()
+    async with snapshot.connection() if snapshot else get_async_engine().connect() as connection:
+        result = await connection.execute(query, params)
+        rows = [tuple(row) for row in result]
+    metric_add(queries=1, query_s=time.perf_counter() - start, rows=len(rows), bytes=_text_bytes(rows))
+
+    if key is not None:
+        if in_memory:
+            _remember(key, rows)
+        await asyncio.to_thread(_write_disk_cache, key, rows)
+    return rows
+
+def _remember(key, rows):
+    with _cache_lock:
+        _memory_cache[key] = rows
+        _memory_cache.move_to_end(key)
+        while len(_memory_cache) > CACHE_MEMORY_ITEMS:
+            _memory_cache.popitem(last=False)
+
+class RunMetrics:
+    """Timings and counters for one report run, per section, written as JSON lines.
+
+    Data fetchers and section builders record into the metrics bound to the current
+    thread (see bind_metrics), so none of their signatures need to carry it.
+    """
+
+    def __init__(self, report_date=None, run_id=None):
+        self.run_id = run_id or uuid.uuid4().hex[:12]
+        self.report_date = report_date
+        self.started_at = datetime.now().isoformat(timespec='seconds')
+        self.run = {}
+        self.fetchers = {}
+        self.sections = {}
+        self._lock = threading.Lock()
+
+    def add(self, group, name, **values):
+        """Adds values into group ('run', 'fetchers' or 'sections') under name."""
+        with self._lock:
+            target = self.run if group == "run" else getattr(self, group).setdefault(name, {})
+            for key, value in values.items():
+                target[key] = target.get(key, 0) + value
+
+    def set(self, **values):
+        with self._lock:
+            self.run.update(values)
+
+    def records(self):
+        """One dict per fetcher, per section and for the whole run."""
+        base = {"run_id": self.run_id, "report_date": self.report_date}
+        records = [dict(base, event="fetch", fetcher=name, **values) for name, values in self.fetchers.items()]
+        for name, values in self.sections.items():
+            record = dict(base, event="section", section=name, **values)
+            if "render_s" in record:
+                record["format_s"] = record["render_s"] - record.get("chart_s", 0)
+            records.append(record)
+        records.append(dict(base, event="run", started_at=self.started_at, **self.run))
+        return records
+
+    def write_jsonl(self, path):
+        with open(path, "w") as file:
+            for record in self.records():
+                file.write(json.dumps(record, default=str) + "\n")
+
+# A context variable rather than a thread-local, so concurrent asyncio tasks on one
+# thread each keep their own binding
+_metrics_binding = contextvars.ContextVar("report_metrics_binding", default=None)
+
+@contextmanager
+def bind_metrics(metrics, group, name):
+    """Makes metric_add/metric_timer in this thread or task record into metrics[group][name]."""
+    token = _metrics_binding.set((metrics, group, name) if metrics is not None else None)
+    try:
+        yield
+    finally:
+        _metrics_binding.reset(token)
+
+def metric_add(**values):
+    """Records values for the fetcher or section bound to this thread or task, if any."""
+    binding = _metrics_binding.get()
+    if binding:
+        metrics, group, name = binding
+        metrics.add(group, name, **values)
+
+@contextmanager
+def metric_timer(key):
+    """Adds the elapsed seconds of the block under key for the bound fetcher or section."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        metric_add(**{key: time.perf_counter() - start})
+
+def _text_bytes(rows):
+    """Approximate payload size of rows as sent over the text protocol."""
+    return sum(len(str(value)) for row in rows for value in row if value is not None)
 
-# Database engine (global for reuse)
-engine = create_engine(DATABASE_URL)
+def metrics_filename(output_file):
+    """JSON lines metrics file written next to output_file."""
+    return f"{os.path.splitext(output_file)[0]}.metrics.jsonl"
 
 def read_procedures_from_file(filename):
     """Reads procedure names from a file, ignoring empty lines and comments."""
@@ -45,43 +817,214 @@ def read_procedures_from_file(filename):
         sys.exit(1)
     return procedures
 
+def read_procedure_graph(filename):
+    """Reads procedures and their dependencies from a procedures file.
+
+    A line is either a procedure name, which runs after the previous line as in a plain
+    serial file, or "name: dep1, dep2", declaring exactly the procedures it must run after
+    ("name:" alone starts a parallel root). Returns {procedure: [dependencies]} in file order.
+    """
+    graph = {}
+    previous = None
+    for line in read_procedures_from_file(filename):
+        name, annotated, deps = line.partition(":")
+        name = name.strip()
+        if annotated:
+            graph[name] = [dep.strip() for dep in deps.split(",") if dep.strip()]
+        else:
+            graph[name] = [previous] if previous else []
+        previous = name
+
+    unknown = {dep for deps in graph.values() for dep in deps if dep not in graph}
+    if unknown:
+        print(f"Error: dependencias no declaradas en '{filename}': {', '.join(sorted(unknown))}")
+        sys.exit(1)
+    # Reject cycles (Kahn's algorithm must consume every procedure)
+    remaining = {name: set(deps) for name, deps in graph.items()}
+    while remaining:
+        ready = [name for name, deps in remaining.items() if not deps]
+        if not ready:
+            print(f"Error: dependencias circulares en '{filename}': {', '.join(sorted(remaining))}")
+            sys.exit(1)
+        for name in ready:
+            del remaining[name]
+        for deps in remaining.values():
+            deps.difference_update(ready)
+    return graph
+
 def execute_procedure(engine, procedure_name):
-    """Executes a PostgreSQL stored procedure with autocommit enabled."""
+    """Executes a PostgreSQL stored procedure with autocommit enabled. Returns True on success."""
     with engine.connect() as connection:
         try:
             print(f"Iniciando ejecución de procedimiento {procedure_name} a las {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
             connection.execution_options(isolation_level="AUTOCOMMIT")
             connection.execute(text(f"CALL {procedure_name}();"))
             print(f"El procedimiento {procedure_name} se ejecutó exitosamente a las {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}.")
+            return True
         except Exception as e:
             print(f"Error executing procedure {procedure_name}: {e}")
+            return False
+
+def _timed_procedure(engine, procedure_name):
+    start = time.perf_counter()
+    ok = execute_procedure(engine, procedure_name)
+    return ok, time.perf_counter() - start
+
+def run_procedures(filename, max_workers=PROCEDURE_WORKERS):
+    """Runs the procedures in filename, independent ones concurrently over separate connections.
+
+    A procedure starts once all its dependencies succeeded; if one fails, everything that
+    depends on it is skipped. Prints per-procedure durations and returns
+    {procedure: (status, seconds)} with status 'ok', 'error' or 'skipped'; when all of them
+    succeeded the report date watermark is refreshed. With REPORT_ASYNC_DB=1 the
+    procedures are awaited on the report's event loop instead.
+    """
+    if ASYNC_DB and async_db_available():
+        results = run_async(run_procedures_async(filename, max_workers))
+        _refresh_after_procedures(results)
+        return results
+
+    graph = read_procedure_graph(filename)
+    engine = get_engine()
+    results = {}
+    pending = dict(graph)
+    running = {}
+    start = time.perf_counter()
+
+    with ThreadPoolExecutor(max_workers=max(1, max_workers)) as executor:
+        def schedule():
+            changed = True
+            while changed:
+                changed = False
+                for name, deps in list(pending.items()):
+                    failed = [dep for dep in deps if dep in results and results[dep][0] != "ok"]
+                    if failed:
+                        print(f"Procedimiento {name} omitido: falló {', '.join(failed)}")
+                        results[name] = ("skipped", 0.0)
+                        del pending[name]
+                        changed = True
+                    elif all(dep in results for dep in deps):
+                        running[executor.submit(_timed_procedure, engine, name)] = name
+                        del pending[name]
+
+        schedule()
+        while running:
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                name = running.pop(future)
+                ok, seconds = future.result()
+                results[name] = ("ok" if ok else "error", seconds)
+            schedule()
+
+    _print_procedure_results(graph, results, time.perf_counter() - start)
+    _refresh_after_procedures(results)
+    return results
+
+async def execute_procedure_async(procedure_name):
+    """execute_procedure on the async engine. Returns True on success."""
+    try:
+        print(f"Iniciando ejecución de procedimiento {procedure_name} a las {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
+        async with get_async_engine().connect() as connection:
+            connection = await connection.execution_options(isolation_level="AUTOCOMMIT")
+            await connection.execute(text(f"CALL {procedure_name}();"))
+        print(f"El procedimiento {procedure_name} se ejecutó exitosamente a las {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}.")
+        return True
+    except Exception as e:
+        print(f"Error executing procedure {procedure_name}: {e}")
+        return False
+
+async def run_procedures_async(filename, max_workers=PROCEDURE_WORKERS):
+    """run_procedures with one task per procedure, each awaiting its dependencies."""
+    graph = read_procedure_graph(filename)
+    limit = asyncio.Semaphore(max(1, max_workers))
+    results = {}
+    start = time.perf_counter()
+
+    async def run(name):
+        statuses = [await tasks[dep] for dep in graph[name]]
+        failed = [dep for dep, status in zip(graph[name], statuses) if status != "ok"]
+        if failed:
+            print(f"Procedimiento {name} omitido: falló {', '.join(failed)}")
+            results[name] = ("skipped", 0.0)
+        else:
+            async with limit:
+                proc_start = time.perf_counter()
+                ok = await execute_procedure_async(name)
+            results[name] = ("ok" if ok else "error", time.perf_counter() - proc_start)
+        return results[name][0]
+
+    # Every task exists before any of them runs, so dependencies can be awaited by name
+    tasks = {}
+    for name in graph:
+        tasks[name] = asyncio.ensure_future(run(name))
+    await asyncio.gather(*tasks.values())
+    _print_procedure_results(graph, results, time.perf_counter() - start)
+    return results
+
+def refresh_report_tables():
+    """Installs the cache change log and moves the report's own tables (date watermark,
+    known funds, daily totals) forward."""
+    install_change_log()
+    refresh_report_date_watermark()
+    refresh_known_funds()
+    refresh_daily_totals()
+
+def _refresh_after_procedures(results):
+    if all(status == "ok" for status, _ in results.values()):
+        refresh_report_tables()
+    else:
+        print("Report date: watermark not refreshed, some procedures did not run")
 
-def add_header_footer(canvas, doc):
-    """Adds header with logo, title including fecha, and footer with page number."""
-    canvas.saveState()
+def _print_procedure_results(graph, results, elapsed):
+    print(f"Procedimientos ({elapsed:.2f}s en total):")
+    for name in graph:
+        status, seconds = results[name]
+        print(f"  {name:<40} {status:<8} {seconds:8.2f}s")
+
+def _define_page_forms(canvas, doc):
+    """Captures the static page furniture once per PDF as form XObjects.
+
+    Logo, title and the fixed part of the footer go into "pageFurniture" and the cover
+    border into "coverBorder"; pages then reference them instead of re-issuing the
+    drawing (and re-reading the logo). Returns the footer prefix, to place the page number.
+    """
+    fecha_value = getattr(doc, 'fecha_value', 'N/A')
+    footer_prefix = f"Generado por Outlier. Fecha:{datetime.now().strftime('%Y-%m-%d')} - "
+
+    canvas.beginForm("pageFurniture")
     canvas.drawImage("./brand_logo.png", 40, 740, width=100, height=45)
     canvas.setFont("MS Sans Serif", 10)
-    fecha_value = getattr(doc, 'fecha_value', 'N/A')
     canvas.drawString(160, 760, f"REPORTE DE FCI. Información al: {fecha_value}")
-    canvas.restoreState()
+    canvas.drawString(40, 15, footer_prefix)
+    canvas.endForm()
+
+    # === Borde para la portada ===
+    canvas.beginForm("coverBorder")
+    canvas.setLineWidth(2)
+    canvas.setStrokeColor(colors.black)
+    canvas.rect(15, 10, 575, 777)  # left, bottom, width, height
+    canvas.endForm()
+    return footer_prefix
+
+def add_header_footer(canvas, doc):
+    """Adds header with logo, title including fecha, and footer with page number."""
+    # Forms are defined on the first page drawn by each canvas (each doc.build gets its own)
+    footer_prefix = getattr(canvas, '_footer_prefix', None)
+    if footer_prefix is None:
+        footer_prefix = canvas._footer_prefix = _define_page_forms(canvas, doc)
 
     canvas.saveState()
+    canvas.doForm("pageFurniture")
     canvas.setFont("MS Sans Serif", 10)
-    canvas.drawString(40, 15, f"Generado por Outlier. Fecha:{datetime.now().strftime('%Y-%m-%d')} - Página {doc.page}")
-    canvas.restoreState()
-
-    # === Borde para la portada ===
+    canvas.drawString(40 + canvas.stringWidth(footer_prefix, "MS Sans Serif", 10), 15, f"Página {doc.page}")
     if doc.page == 1:  # solo la primera página (portada)
-        canvas.saveState()
-        canvas.setLineWidth(2)
-        canvas.setStrokeColor(colors.black)
-        canvas.rect(15, 10, 575, 777)  # left, bottom, width, height
-        canvas.restoreState()
+        canvas.doForm("coverBorder")
+    canvas.restoreState()
 
 def sub_report_cover(report_date):
     """Generates a cover page with a large title and date information, starting a few lines down."""
     elements = []
-    styles = getSampleStyleSheet()
+    styles = section_styles()
 
     # Custom style for the title
     title_style = ParagraphStyle(
@@ -126,64 +1069,62 @@ def sub_report_cover(report_date):
     print("Cover: Title and date added")
     return elements
 
-def sub_report_efec_gerente(report_date):
-    """Generates a sub-report with net subscription effects by gerente."""
-    elements = []
-    styles = getSampleStyleSheet()
-
-    # Query database with dynamic date
-    with engine.connect() as connection:
-        query = text("""
-            SELECT 
-                ei.fecha_imputada,
-                soc.gerente,
-                SUM(ROUND(ei.es_1d::numeric / 1e6, 2)) AS es_1d,
-                SUM(ROUND(ei.es_1w::numeric / 1e6, 2)) AS es_1w,
-                SUM(ROUND(ei.es_mtd::numeric / 1e6, 2)) AS es_mtd,
-                SUM(ROUND(ei.es_1m::numeric / 1e6, 2)) AS es_1m,
-                SUM(ROUND(ei.es_3m::numeric / 1e6, 2)) AS es_3m,
-                SUM(ROUND(ei.es_ytd::numeric / 1e6, 2)) AS es_ytd,
-                SUM(ROUND(ei.es_1y::numeric / 1e6, 2)) AS es_1y
-            FROM efectos_intertemp_pesos ei
-            JOIN "clasesFCI" cf ON ei.fondo = cf.fondo 
-                AND (ei.fecha_imputada BETWEEN cf.desde AND COALESCE(cf.hasta, CURRENT_DATE))
-            JOIN fci_diaria_2 fci ON fci.fondo = ei.fondo AND fci.fecha_imputada = ei.fecha_imputada
-            JOIN sociedades soc ON fci."sociedadGerente" = soc."sociedadGerente"
-            WHERE ei.fecha_imputada = :report_date
-            GROUP BY ei.fecha_imputada, soc.gerente
-            ORDER BY es_1d DESC
-        """)
-        result = connection.execute(query, {"report_date": report_date})
-        data = result.fetchall()
-
-    if not data:
-        elements.append(Paragraph("No data available for Efectos Gerente report.", styles['Normal']))
-        elements.append(PageBreak())
-        return elements
-
-    # Title
-    title = Paragraph("EFECTOS DE SUSCRIPCION NETOS POR GERENTE (en millones):", styles['Heading2'])
-    elements.append(title)
-    elements.append(Spacer(1, 10))
-    elements.append(Paragraph(f"Fecha: {report_date}", styles['Normal']))
-    elements.append(Spacer(1, 5))
-
-    # Table (excluding fecha_imputada)
-    table_data = [["GERENTE", "1D", "1SEM", "MTD", "1M", "3M", "YTD", "1Y"]]
-    for row in data:
-        table_data.append([
-            row[1],  # gerente -> GERENTE
-            "{:,.2f}".format(row[2]).replace(",", "."),  # es_1d -> 1D
-            "{:,.2f}".format(row[3]).replace(",", "."),  # es_1w -> 1SEM
-            "{:,.2f}".format(row[4]).replace(",", "."),  # es_mtd -> MTD
-            "{:,.2f}".format(row[5]).replace(",", "."),  # es_1m -> 1M
-            "{:,.2f}".format(row[6]).replace(",", "."),  # es_3m -> 3M
-            "{:,.2f}".format(row[7]).replace(",", "."),  # es_ytd -> YTD
-            "{:,.2f}".format(row[8]).replace(",", ".")   # es_1y -> 1Y
-        ])
-    
-    table = Table(table_data, colWidths=[165, 50, 50, 50, 50, 50, 50, 50], hAlign='LEFT', repeatRows=1)
-    table.setStyle(TableStyle([
+def format_column(values, spec, null=""):
+    """Formats a whole column of numbers (Decimal, float or int) with a single format call.
+
+    spec is a format spec such as ",.0f" or ".3%"; thousands separators come out
+    Argentine-style (1.234.567) and None values become null.
+    """
+    present = [v for v in values if v is not None]
+    if not present:
+        return [null] * len(values)
+    joined = ("{:" + spec + "}\n") * len(present)
+    joined = joined.format(*present)
+    if "," in spec:
+        joined = joined.replace(",", ".")
+    formatted = joined.split("\n")[:-1]
+    if len(present) == len(values):
+        return formatted
+    formatted = iter(formatted)
+    return [null if v is None else next(formatted) for v in values]
+
+def format_thousands(values, decimals=0):
+    """Column of amounts as 1.234.567 (or 1.234.567.89 with decimals)."""
+    return format_column(values, f",.{decimals}f")
+
+def format_percent(values, decimals=3):
+    """Column of ratios as percentages, e.g. 0.01234 -> 1.234%."""
+    return format_column(values, f".{decimals}%")
+
+def format_table_rows(rows, formatters, skip=0):
+    """Formats rows column by column; formatters maps column index -> column formatter.
+
+    The first skip fields of each row are dropped and columns without a formatter are
+    passed through unchanged. Rows are formatted REPORT_CHUNK_ROWS at a time, so
+    only one batch is ever transposed. Returns a list of lists.
+    """
+    table = []
+    for start in range(0, len(rows), CHUNK_ROWS):
+        columns = list(zip(*rows[start:start + CHUNK_ROWS]))[skip:]
+        for index, formatter in formatters.items():
+            columns[index] = formatter(columns[index])
+        table.extend(list(row) for row in zip(*columns))
+    return table
+
+# Page geometry shared by the document template and the pre-paginated tables
+PAGE_MARGINS = dict(leftMargin=30, rightMargin=30, topMargin=80, bottomMargin=40)
+FRAME_PADDING = 6  # SimpleDocTemplate's frames pad 6pt on every side
+FRAME_WIDTH = letter[0] - PAGE_MARGINS['leftMargin'] - PAGE_MARGINS['rightMargin'] - 2 * FRAME_PADDING
+FRAME_HEIGHT = letter[1] - PAGE_MARGINS['topMargin'] - PAGE_MARGINS['bottomMargin'] - 2 * FRAME_PADDING
+
+def flowables_height(flowables, width=FRAME_WIDTH):
+    """Vertical space flowables take in a frame, including their space before and after."""
+    return sum(f.wrap(width, FRAME_HEIGHT)[1] + f.getSpaceBefore() + f.getSpaceAfter() for f in flowables)
+
+# Table looks shared by the table sections, compiled once. "compact" rows are a fixed
+# leading + padding tall, which paginated_tables relies on.
+TABLE_STYLES = {
+    "normal": TableStyle([
         ('BACKGROUND', (0, 0), (-1, 0), colors.grey),
         ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
         ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
@@ -191,125 +1132,415 @@ def sub_report_efec_gerente(report_date):
         ('FONTSIZE', (0, 0), (-1, -1), 8),
         ('GRID', (0, 0), (-1, -1), 0.25, colors.black),
         ('BOX', (0, 0), (-1, -1), 1, colors.black),
-    ]))
-    elements.append(table)
-    elements.append(PageBreak())
-    
-    print("Efectos Gerente: Table added")
-    return elements
-
-def sub_report_efec_subcategoria(report_date):
-    """Generates a sub-report with net subscription effects by subcategory."""
-    elements = []
-    styles = getSampleStyleSheet()
-
-    # Query database with dynamic date
-    with engine.connect() as connection:
-        query = text("""
-            SELECT 
-                ei.fecha_imputada,
-                cf."subCategoria",
-                SUM(ROUND(ei.es_1d::numeric / 1e6, 0)) AS es_1d,
-                SUM(ROUND(ei.es_1w::numeric / 1e6, 0)) AS es_1w,
-                SUM(ROUND(ei.es_mtd::numeric / 1e6, 0)) AS es_mtd,
-                SUM(ROUND(ei.es_1m::numeric / 1e6, 0)) AS es_1m,
-                SUM(ROUND(ei.es_3m::numeric / 1e6, 0)) AS es_3m,
-                SUM(ROUND(ei.es_ytd::numeric / 1e6, 0)) AS es_ytd,
-                SUM(ROUND(ei.es_1y::numeric / 1e6, 0)) AS es_1y
-            FROM efectos_intertemp ei
-            JOIN "clasesFCI" cf ON ei.fondo = cf.fondo 
-                AND (ei.fecha_imputada BETWEEN cf.desde AND COALESCE(cf.hasta, CURRENT_DATE))
-            WHERE ei.fecha_imputada = :report_date
-            GROUP BY ei.fecha_imputada, cf."subCategoria"
-            ORDER BY es_1d
-        """)
-        result = connection.execute(query, {"report_date": report_date})
-        data = result.fetchall()
-
-    if not data:
-        elements.append(Paragraph("No data available for Efectos Subcategoria report.", styles['Normal']))
-        elements.append(PageBreak())
-        return elements
-
-    # Title
-    title = Paragraph("EFECTOS DE SUSCRIPCION NETOS POR SUBCATEGORIA (en millones):", styles['Heading2'])
-    elements.append(title)
-    elements.append(Spacer(1, 10))
-    elements.append(Paragraph(f"Fecha: {report_date}", styles['Normal']))
-    elements.append(Spacer(1, 5))
-
-    # Table
-    table_data = [["SUB-CATEGORIA", "1D", "1SEM", "MTD", "1M", "3M", "YTD", "1Y"]]
-    for row in data:
-        table_data.append([
-            row[1],  # subCategoria
-            "{:,.0f}".format(row[2]).replace(",", "."),  # es_1d
-            "{:,.0f}".format(row[3]).replace(",", "."),  # es_1w
-            "{:,.0f}".format(row[4]).replace(",", "."),  # es_mtd
-            "{:,.0f}".format(row[5]).replace(",", "."),  # es_1m
-            "{:,.0f}".format(row[6]).replace(",", "."),  # es_3m
-            "{:,.0f}".format(row[7]).replace(",", "."),  # es_ytd
-            "{:,.0f}".format(row[8]).replace(",", ".")   # es_1y
-        ])
-    
-    table = Table(table_data, colWidths=[161, 50, 50, 50, 50, 50, 50, 50], hAlign='LEFT', repeatRows=1)
-    table.setStyle(TableStyle([
+    ]),
+    "compact": TableStyle([
         ('BACKGROUND', (0, 0), (-1, 0), colors.grey),
         ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
         ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
         ('FONTNAME', (0, 0), (-1, -1), 'MS Sans Serif'),
-        ('FONTSIZE', (0, 0), (-1, -1), 8),
+        ('FONTSIZE', (0, 0), (-1, -1), 6),
+        ('LEADING', (0, 0), (-1, -1), 6),
+        ('TOPPADDING', (0, 0), (-1, -1), 0.5),
+        ('BOTTOMPADDING', (0, 0), (-1, -1), 0.6),
         ('GRID', (0, 0), (-1, -1), 0.25, colors.black),
         ('BOX', (0, 0), (-1, -1), 1, colors.black),
-    ]))
-    elements.append(table)
-    elements.append(PageBreak())
-    
-    print("Efectos Subcategoria: Table added")
-    return elements
-
-
-
-def sub_report_summary(report_date):
+    ]),
+}
+TABLE_ROW_METRICS = {"compact": dict(leading=6, padding=0.5 + 0.6)}
+
+_section_styles = None
+
+def section_styles():
+    """The sample stylesheet, built once per process and shared by every section."""
+    global _section_styles
+    if _section_styles is None:
+        _section_styles = getSampleStyleSheet()
+    return _section_styles
+
+def paginated_tables(table_data, col_widths, style, leading, padding, first_page_height=FRAME_HEIGHT):
+    """Splits a long table into one Table per page, each repeating the header row.
+
+    Cells are plain strings, so every row is leading * lines + padding (top plus bottom)
+    tall and the split can be computed up front instead of letting reportlab measure and
+    re-split one huge table page after page. first_page_height is the room left on the
+    page the table starts on. style is the TableStyle every page table gets.
+    """
+    heights = [leading * max(str(v).count("\n") + 1 if v is not None else 1 for v in row) + padding
+               for row in table_data]
+    header, header_height = table_data[:1], heights[0]
+    tables = []
+    available = first_page_height
+    start, used = 1, header_height
+    for i in range(1, len(table_data)):
+        if used + heights[i] > available and i > start:
+            tables.append((start, i))
+            available, start, used = FRAME_HEIGHT, i, header_height
+        used += heights[i]
+    tables.append((start, len(table_data)))
+
+    result = []
+    for start, end in tables:
+        # repeatRows stays as a safety net in case a chunk still has to split
+        table = Table(header + table_data[start:end], colWidths=col_widths,
+                      rowHeights=heights[:1] + heights[start:end], hAlign='LEFT', repeatRows=1)
+        table.setStyle(style)
+        result.append(table)
+    return result
+
+def _date_range_params(report_dates):
+    """Bind parameters covering every date in report_dates (ISO strings), as dates.
+
+    Dates rather than strings, since asyncpg does not cast text parameters to date.
+    """
+    return {
+        "date_from": datetime.strptime(min(report_dates), '%Y-%m-%d').date(),
+        "date_to": datetime.strptime(max(report_dates), '%Y-%m-%d').date(),
+    }
+
+# Tables read by the shared effects query (used for its cache watermark)
+EFECTOS_SOURCES = ("efectos_intertemp_pesos", "efectos_intertemp", "clasesFCI", "fci_diaria_2", "sociedades")
+
+def _sort_efectos(rows, descending=False):
+    """Sorts effect rows by their 1D column, with NULLs placed like PostgreSQL does."""
+    return sorted(rows, key=lambda row: (row[2] is None, row[2]), reverse=descending)
+
+EFECTOS_QUERY = text("""
+    WITH efectos AS (
+        SELECT
+            ei.fondo, ei.fecha_imputada, cf.categoria,
+            ei.es_1d, ei.es_1w, ei.es_mtd, ei.es_1m, ei.es_3m, ei.es_ytd, ei.es_1y
+        FROM efectos_intertemp_pesos ei
+        JOIN "clasesFCI" cf ON ei.fondo = cf.fondo 
+            AND (ei.fecha_imputada BETWEEN cf.desde AND COALESCE(cf.hasta, CURRENT_DATE))
+        WHERE ei.fecha_imputada BETWEEN :date_from AND :date_to
+    ),
+    -- Each cut aggregates over its own rows: categoria never joins fci_diaria_2/sociedades,
+    -- gerente keeps the original inner joins
+    cortes AS (
+        SELECT 'categoria' AS corte, fecha_imputada, categoria AS clave,
+               es_1d, es_1w, es_mtd, es_1m, es_3m, es_ytd, es_1y
+        FROM efectos
+        UNION ALL
+        SELECT 'gerente', e.fecha_imputada, soc.gerente,
+               e.es_1d, e.es_1w, e.es_mtd, e.es_1m, e.es_3m, e.es_ytd, e.es_1y
+        FROM efectos e
+        JOIN fci_diaria_2 fci ON fci.fondo = e.fondo AND fci.fecha_imputada = e.fecha_imputada
+        JOIN sociedades soc ON fci."sociedadGerente" = soc."sociedadGerente"
+    )
+    SELECT
+        corte,
+        fecha_imputada,
+        clave,
+        SUM(ROUND(es_1d::numeric / 1e6, 0)) AS es_1d,
+        SUM(ROUND(es_1w::numeric / 1e6, 0)) AS es_1w,
+        SUM(ROUND(es_mtd::numeric / 1e6, 0)) AS es_mtd,
+        SUM(ROUND(es_1m::numeric / 1e6, 0)) AS es_1m,
+        SUM(ROUND(es_3m::numeric / 1e6, 0)) AS es_3m,
+        SUM(ROUND(es_ytd::numeric / 1e6, 0)) AS es_ytd,
+        SUM(ROUND(es_1y::numeric / 1e6, 0)) AS es_1y,
+        SUM(ROUND(es_1d::numeric / 1e6, 2)) AS es_1d_2,
+        SUM(ROUND(es_1w::numeric / 1e6, 2)) AS es_1w_2,
+        SUM(ROUND(es_mtd::numeric / 1e6, 2)) AS es_mtd_2,
+        SUM(ROUND(es_1m::numeric / 1e6, 2)) AS es_1m_2,
+        SUM(ROUND(es_3m::numeric / 1e6, 2)) AS es_3m_2,
+        SUM(ROUND(es_ytd::numeric / 1e6, 2)) AS es_ytd_2,
+        SUM(ROUND(es_1y::numeric / 1e6, 2)) AS es_1y_2
+    FROM cortes
+    GROUP BY corte, fecha_imputada, clave
+
+    UNION ALL
+
+    SELECT 
+        'subcategoria' AS corte,
+        ei.fecha_imputada,
+        cf."subCategoria" AS clave,
+        SUM(ROUND(ei.es_1d::numeric / 1e6, 0)),
+        SUM(ROUND(ei.es_1w::numeric / 1e6, 0)),
+        SUM(ROUND(ei.es_mtd::numeric / 1e6, 0)),
+        SUM(ROUND(ei.es_1m::numeric / 1e6, 0)),
+        SUM(ROUND(ei.es_3m::numeric / 1e6, 0)),
+        SUM(ROUND(ei.es_ytd::numeric / 1e6, 0)),
+        SUM(ROUND(ei.es_1y::numeric / 1e6, 0)),
+        NULL, NULL, NULL, NULL, NULL, NULL, NULL
+    FROM efectos_intertemp ei
+    JOIN "clasesFCI" cf ON ei.fondo = cf.fondo 
+        AND (ei.fecha_imputada BETWEEN cf.desde AND COALESCE(cf.hasta, CURRENT_DATE))
+    WHERE ei.fecha_imputada BETWEEN :date_from AND :date_to
+    GROUP BY ei.fecha_imputada, cf."subCategoria"
+""")
+
+def fetch_efectos_range(report_dates):
+    """Fetches the categoria, subcategoria and gerente effect tables in a single round-trip.
+
+    Categoria and gerente share one scan of efectos_intertemp_pesos; only the gerente cut
+    joins fci_diaria_2 and sociedades, so categoria totals match the original query.
+    Subcategoria is still computed from efectos_intertemp and travels in the same statement.
+    Returns {report_date: {slice: rows}} for every date in report_dates, with rows shaped
+    like the original per-section queries.
+    """
+    data = run_query(EFECTOS_QUERY, _date_range_params(report_dates), sources=EFECTOS_SOURCES)
+    return _efectos_by_date(data, report_dates)
+
+async def fetch_efectos_range_async(report_dates):
+    data = await run_query_async(EFECTOS_QUERY, _date_range_params(report_dates), sources=EFECTOS_SOURCES)
+    return _efectos_by_date(data, report_dates)
+
+def _efectos_by_date(data, report_dates):
+    by_date = {d: {"categoria": [], "subcategoria": [], "gerente": []} for d in report_dates}
+    for row in data:
+        efectos = by_date.get(str(row[1]))
+        if efectos is None:
+            continue
+        if row[0] == "gerente":
+            # Gerente amounts are rounded to 2 decimals per fund
+            efectos["gerente"].append((row[1], row[2]) + tuple(row[10:17]))
+        else:
+            efectos[row[0]].append((row[1], row[2]) + tuple(row[3:10]))
+
+    for efectos in by_date.values():
+        efectos["categoria"] = _sort_efectos(efectos["categoria"])
+        efectos["subcategoria"] = _sort_efectos(efectos["subcategoria"])
+        efectos["gerente"] = _sort_efectos(efectos["gerente"], descending=True)
+    return by_date
+
+def fetch_efectos(report_date):
+    """Fetches the three effect tables for a single date."""
+    return fetch_efectos_range([report_date])[report_date]
+
+SUMMARY_AUM_SOURCES = ("report_aum_familia_2",)
+SUMMARY_SUBSCRIPTIONS_SOURCES = ("efectos_base", "efectos_base_pesos")
+
+# AUM: every date from the 6th before the first report date up to the last one
+SUMMARY_AUM_SCAN_QUERY = text("""
+    SELECT fecha_imputada, SUM(patrimonio) / 1e12 AS total_aum
+    FROM report_aum_familia_2
+    WHERE fecha_imputada <= :date_to
+      AND fecha_imputada >= COALESCE((
+          SELECT MIN(fecha_imputada)
+          FROM (
+              SELECT DISTINCT fecha_imputada
+              FROM report_aum_familia_2
+              WHERE fecha_imputada <= :date_from
+              ORDER BY fecha_imputada DESC
+              LIMIT 6
+          ) ultimas
+      ), :date_from)
+    GROUP BY fecha_imputada
+    ORDER BY fecha_imputada DESC
+""")
+
+# Subscriptions: last 6 dates, independent of the report date
+SUMMARY_SUBSCRIPTIONS_SCAN_QUERY = text("""
+    SELECT 
+        eb.fecha_imputada,
+        SUM(ROUND(eb.es_1d::numeric / 1e6, 0)) AS suscripciones
+    FROM 
+        efectos_base eb
+    WHERE 
+        eb.fecha_imputada IN (
+            SELECT DISTINCT fecha_imputada
+            FROM efectos_base_pesos
+            ORDER BY fecha_imputada DESC
+            LIMIT 6
+        )
+    GROUP BY 
+        eb.fecha_imputada
+    ORDER BY 
+        eb.fecha_imputada DESC
+""")
+
+# Per-date totals the summary reads, kept in report_totales_diarios. Dates before
+# report_totales_diarios_estado.hasta (bound as :hasta) are read from it; later ones are
+# aggregated on the fly.
+DAILY_TOTALS_DDL = (
+    text("""
+        CREATE TABLE IF NOT EXISTS report_totales_diarios (
+            fecha_imputada date PRIMARY KEY,
+            total_aum numeric,
+            suscripciones numeric,
+            con_efectos_pesos boolean NOT NULL
+        )
+    """),
+    text("""
+        CREATE TABLE IF NOT EXISTS report_totales_diarios_estado (
+            id boolean PRIMARY KEY DEFAULT true CHECK (id),
+            hasta date,
+            actualizado timestamptz NOT NULL DEFAULT now()
+        )
+    """),
+)
+
+def _daily_totals_select(since):
+    """Totals for every date on or after the SQL expression since, from the source tables."""
+    return f"""
+        SELECT d.fecha_imputada,
+               (SELECT SUM(a.patrimonio) / 1e12 FROM report_aum_familia_2 a
+                WHERE a.fecha_imputada = d.fecha_imputada) AS total_aum,
+               (SELECT SUM(ROUND(eb.es_1d::numeric / 1e6, 0)) FROM efectos_base eb
+                WHERE eb.fecha_imputada = d.fecha_imputada) AS suscripciones,
+               EXISTS (SELECT 1 FROM efectos_base_pesos p
+                       WHERE p.fecha_imputada = d.fecha_imputada) AS con_efectos_pesos
+        FROM (
+            SELECT fecha_imputada FROM report_aum_familia_2 WHERE fecha_imputada >= {since}
+            UNION
+            SELECT fecha_imputada FROM efectos_base WHERE fecha_imputada >= {since}
+            UNION
+            SELECT fecha_imputada FROM efectos_base_pesos WHERE fecha_imputada >= {since}
+        ) d
+    """
+
+DAILY_TOTALS_HASTA = "COALESCE(CAST(:hasta AS date), '-infinity'::date)"
+
+# Stored dates plus the ones after the last refresh, so the summary never waits for it
+DAILY_TOTALS_CTE = f"""
+    WITH totales AS (
+        SELECT fecha_imputada, total_aum, suscripciones, con_efectos_pesos
+        FROM report_totales_diarios
+        WHERE fecha_imputada < {DAILY_TOTALS_HASTA}
+        UNION ALL
+        {_daily_totals_select(DAILY_TOTALS_HASTA)}
+    )
+"""
+
+DAILY_TOTALS_SOURCES = (("report_totales_diarios", "report_totales_diarios_estado")
+                        + SUMMARY_AUM_SOURCES + SUMMARY_SUBSCRIPTIONS_SOURCES)
+
+SUMMARY_AUM_QUERY = text(DAILY_TOTALS_CTE + """
+    SELECT fecha_imputada, total_aum
+    FROM totales
+    WHERE total_aum IS NOT NULL
+      AND fecha_imputada <= :date_to
+      AND fecha_imputada >= COALESCE((
+          SELECT MIN(fecha_imputada)
+          FROM (
+              SELECT fecha_imputada
+              FROM totales
+              WHERE total_aum IS NOT NULL AND fecha_imputada <= :date_from
+              ORDER BY fecha_imputada DESC
+              LIMIT 6
+          ) ultimas
+      ), :date_from)
+    ORDER BY fecha_imputada DESC
+""")
+
+SUMMARY_SUBSCRIPTIONS_QUERY = text(DAILY_TOTALS_CTE + """
+    SELECT fecha_imputada, suscripciones
+    FROM totales
+    WHERE suscripciones IS NOT NULL
+      AND fecha_imputada IN (
+          SELECT fecha_imputada
+          FROM totales
+          WHERE con_efectos_pesos
+          ORDER BY fecha_imputada DESC
+          LIMIT 6
+      )
+    ORDER BY fecha_imputada DESC
+""")
+
+# Every date is aggregated again and compared with the stored totals; only the dates whose
+# totals differ (corrections at any date, late rows, new dates) are written
+DAILY_TOTALS_DESDE = "COALESCE(CAST(:desde AS date), '-infinity'::date)"
+
+REFRESH_DAILY_TOTALS_QUERY = text(f"""
+    WITH actuales AS (
+        {_daily_totals_select(DAILY_TOTALS_DESDE)}
+    ),
+    borradas AS (
+        DELETE FROM report_totales_diarios t
+        WHERE t.fecha_imputada >= {DAILY_TOTALS_DESDE}
+            AND NOT EXISTS (SELECT 1 FROM actuales a WHERE a.fecha_imputada = t.fecha_imputada)
+    )
+    INSERT INTO report_totales_diarios (fecha_imputada, total_aum, suscripciones, con_efectos_pesos)
+    SELECT fecha_imputada, total_aum, suscripciones, con_efectos_pesos FROM actuales
+    ON CONFLICT (fecha_imputada) DO UPDATE
+    SET total_aum = EXCLUDED.total_aum, suscripciones = EXCLUDED.suscripciones,
+        con_efectos_pesos = EXCLUDED.con_efectos_pesos
+    WHERE (report_totales_diarios.total_aum, report_totales_diarios.suscripciones,
+           report_totales_diarios.con_efectos_pesos)
+          IS DISTINCT FROM (EXCLUDED.total_aum, EXCLUDED.suscripciones, EXCLUDED.con_efectos_pesos)
+""")
+
+DAILY_TOTALS_STATE_QUERY = text("""
+    INSERT INTO report_totales_diarios_estado (id, hasta, actualizado)
+    SELECT true, MAX(fecha_imputada), now() FROM report_totales_diarios
+    ON CONFLICT (id) DO UPDATE SET hasta = EXCLUDED.hasta, actualizado = now()
+""")
+
+def refresh_daily_totals():
+    """Brings report_totales_diarios in line with its source tables.
+
+    Totals are aggregated for the dates from REPORT_REFRESH_DAYS before the last stored one
+    on (index ranges on the source tables; the first refresh reads the whole history) and
+    only the ones that changed are written, so a correction to a recent date is picked up
+    like a new date. Returns False if the tables could not be created or updated.
+    """
+    start = time.perf_counter()
+    try:
+        with get_engine().begin() as connection:
+            for statement in DAILY_TOTALS_DDL:
+                connection.execute(statement)
+            desde = _refresh_desde(connection, "report_totales_diarios_estado")
+            changed = connection.execute(REFRESH_DAILY_TOTALS_QUERY, {"desde": desde}).rowcount
+            connection.execute(DAILY_TOTALS_STATE_QUERY)
+            hasta = connection.execute(text("SELECT hasta FROM report_totales_diarios_estado")).scalar()
+    except Exception as e:
+        print(f"Daily totals: could not refresh report_totales_diarios: {str(e)}")
+        return False
+    _ready_tables.add("report_totales_diarios_estado")
+    print(f"Daily totals: updated {changed} new or changed dates, up to {hasta}, "
+          f"in {time.perf_counter() - start:.2f}s")
+    return True
+
+def fetch_summary_range(report_dates):
+    """Fetches AUM and net subscriptions for the last 6 dates up to each report date.
+
+    Only reads: report_totales_diarios is kept current by refresh_daily_totals, which runs
+    after the procedures (or with --refresh-tables).
+    """
+    if derived_table_ready("report_totales_diarios_estado"):
+        params = {"hasta": derived_table_hasta("report_totales_diarios_estado")}
+        aum_rows = run_query(SUMMARY_AUM_QUERY, {**_date_range_params(report_dates), **params},
+                             sources=DAILY_TOTALS_SOURCES)
+        sub_data = run_query(SUMMARY_SUBSCRIPTIONS_QUERY, params, sources=DAILY_TOTALS_SOURCES)
+    else:
+        aum_rows = run_query(SUMMARY_AUM_SCAN_QUERY, _date_range_params(report_dates), sources=SUMMARY_AUM_SOURCES)
+        sub_data = run_query(SUMMARY_SUBSCRIPTIONS_SCAN_QUERY, sources=SUMMARY_SUBSCRIPTIONS_SOURCES)
+    return _summary_by_date(aum_rows, sub_data, report_dates)
+
+async def fetch_summary_range_async(report_dates):
+    if await asyncio.to_thread(derived_table_ready, "report_totales_diarios_estado"):
+        params = {"hasta": await derived_table_hasta_async("report_totales_diarios_estado")}
+        aum_rows, sub_data = await asyncio.gather(
+            run_query_async(SUMMARY_AUM_QUERY, {**_date_range_params(report_dates), **params},
+                            sources=DAILY_TOTALS_SOURCES),
+            run_query_async(SUMMARY_SUBSCRIPTIONS_QUERY, params, sources=DAILY_TOTALS_SOURCES),
+        )
+    else:
+        aum_rows, sub_data = await asyncio.gather(
+            run_query_async(SUMMARY_AUM_SCAN_QUERY, _date_range_params(report_dates), sources=SUMMARY_AUM_SOURCES),
+            run_query_async(SUMMARY_SUBSCRIPTIONS_SCAN_QUERY, sources=SUMMARY_SUBSCRIPTIONS_SOURCES),
+        )
+    return _summary_by_date(aum_rows, sub_data, report_dates)
+
+def _summary_by_date(aum_rows, sub_data, report_dates):
+    # AUM rows come newest first, so each date takes the first 6 rows not after it
+    return {
+        d: ([row for row in aum_rows if str(row[0]) <= d][:6], sub_data)
+        for d in report_dates
+    }
+
+def fetch_summary(report_date):
+    """Fetches AUM and net subscriptions for the last 6 dates."""
+    return fetch_summary_range([report_date])[report_date]
+
+def sub_report_summary(report_date, data=None):
     """Generates a sub-report with two Matplotlib bar charts side by side: AUM and Subscriptions."""
     elements = []
-    styles = getSampleStyleSheet()
+    styles = section_styles()
 
-    # Query for AUM (last 6 rows)
-    with engine.connect() as connection:
-        aum_query = text("""
-            SELECT fecha_imputada, SUM(patrimonio) / 1e12 AS total_aum
-            FROM report_aum_familia_2
-            WHERE fecha_imputada <= :report_date
-            GROUP BY fecha_imputada
-            ORDER BY fecha_imputada DESC
-            LIMIT 6
-        """)
-        aum_result = connection.execute(aum_query, {"report_date": report_date})
-        aum_data = aum_result.fetchall()
-
-    # Query for Subscriptions (last 6 dates)
-    with engine.connect() as connection:
-        sub_query = text("""
-            SELECT 
-                eb.fecha_imputada,
-                SUM(ROUND(eb.es_1d::numeric / 1e6, 0)) AS suscripciones
-            FROM 
-                efectos_base eb
-            WHERE 
-                eb.fecha_imputada IN (
-                    SELECT DISTINCT fecha_imputada
-                    FROM efectos_base_pesos
-                    ORDER BY fecha_imputada DESC
-                    LIMIT 6
-                )
-            GROUP BY 
-                eb.fecha_imputada
-            ORDER BY 
-                eb.fecha_imputada DESC
-        """)
-        sub_result = connection.execute(sub_query)
-        sub_data = sub_result.fetchall()
+    if data is None:
+        data = fetch_summary(report_date)
+    aum_data, sub_data = data
 
     if not aum_data:
         elements.append(Paragraph("No AUM data available for Summary report.", styles['Normal']))
@@ -326,8 +1557,11 @@ def sub_report_summary(report_date):
     elements.append(Spacer(1, 10))
 
     # First chart: AUM
-    aum_chart_path = None
+    aum_chart = None
+    chart_start = time.perf_counter()
     try:
+        plt = load_pyplot()
+
         # Reverse data for chart (oldest first)
         aum_fechas = [datetime.strptime(str(row[0]), '%Y-%m-%d') for row in aum_data[::-1]]
         aum_values = [float(row[1]) for row in aum_data[::-1]]
@@ -368,18 +1602,14 @@ def sub_report_summary(report_date):
 
         plt.tight_layout()
 
-        # Save to temp directory
-        temp_dir = tempfile.gettempdir()
-        aum_chart_path = os.path.join(temp_dir, "aum_chart.png")
-        plt.savefig(aum_chart_path, dpi=300, bbox_inches='tight')
+        # Render to an in-memory PNG handed straight to the PDF
+        aum_chart = io.BytesIO()
+        plt.savefig(aum_chart, format='png', dpi=300, bbox_inches='tight')
         plt.close()
+        aum_chart.seek(0)
+        metric_add(chart_s=time.perf_counter() - chart_start)
 
-        # Verify file exists
-        time.sleep(0.1)
-        if not os.path.exists(aum_chart_path):
-            raise FileNotFoundError(f"AUM chart file not created: {aum_chart_path}")
-
-        print("Summary: AUM chart added (path: %s)" % aum_chart_path)
+        print("Summary: AUM chart added (%d bytes)" % aum_chart.getbuffer().nbytes)
 
     except Exception as e:
         print(f"Summary: AUM chart error: {str(e)}")
@@ -388,8 +1618,9 @@ def sub_report_summary(report_date):
         return elements
 
     # Second chart: Subscriptions
-    sub_chart_path = None
+    sub_chart = None
     if sub_data:
+        chart_start = time.perf_counter()
         try:
             # Reverse data for chart (oldest first)
             sub_fechas = [datetime.strptime(str(row[0]), '%Y-%m-%d') for row in sub_data[::-1]]
@@ -435,17 +1666,14 @@ def sub_report_summary(report_date):
 
             plt.tight_layout()
 
-            # Save to temp directory
-            sub_chart_path = os.path.join(temp_dir, "sub_chart.png")
-            plt.savefig(sub_chart_path, dpi=300, bbox_inches='tight')
+            # Render to an in-memory PNG handed straight to the PDF
+            sub_chart = io.BytesIO()
+            plt.savefig(sub_chart, format='png', dpi=300, bbox_inches='tight')
             plt.close()
+            sub_chart.seek(0)
+            metric_add(chart_s=time.perf_counter() - chart_start)
 
-            # Verify file exists
-            time.sleep(0.1)
-            if not os.path.exists(sub_chart_path):
-                raise FileNotFoundError(f"Subscriptions chart file not created: {sub_chart_path}")
-
-            print("Summary: Subscriptions chart added (path: %s)" % sub_chart_path)
+            print("Summary: Subscriptions chart added (%d bytes)" % sub_chart.getbuffer().nbytes)
 
         except Exception as e:
             print(f"Summary: Subscriptions chart error: {str(e)}")
@@ -457,9 +1685,9 @@ def sub_report_summary(report_date):
         elements.append(Paragraph("No Subscriptions data available.", styles['Normal']))
 
     # Place charts side by side with adjusted left margin
-    if aum_chart_path and sub_chart_path:
-        aum_chart_image = Image(aum_chart_path, width=250, height=250)
-        sub_chart_image = Image(sub_chart_path, width=250, height=250)
+    if aum_chart and sub_chart:
+        aum_chart_image = Image(aum_chart, width=250, height=250)
+        sub_chart_image = Image(sub_chart, width=250, height=250)
         side_by_side = Table([[aum_chart_image, sub_chart_image]], colWidths=[250, 250])
         side_by_side.setStyle(TableStyle([
             ('VALIGN', (0, 0), (-1, -1), 'MIDDLE'),
@@ -467,8 +1695,8 @@ def sub_report_summary(report_date):
             ('LEFTPADDING', (0, 0), (-1, -1), -20),
         ]))
         elements.append(side_by_side)
-    elif aum_chart_path:
-        aum_chart_image = Image(aum_chart_path, width=250, height=250)
+    elif aum_chart:
+        aum_chart_image = Image(aum_chart, width=250, height=250)
         elements.append(aum_chart_image)
     else:
         elements.append(Paragraph("No charts generated.", styles['Normal']))
@@ -482,41 +1710,246 @@ def sub_report_summary(report_date):
 
 
 
-def generate_multi_report_pdf(output_file, sub_report_functions, report_date):
-    """Generate a PDF with multiple sub-reports, handle image cleanup."""
-    doc = SimpleDocTemplate(output_file, pagesize=letter, leftMargin=30, rightMargin=30, topMargin=80, bottomMargin=40)
-    all_elements = []
-    image_paths = []
-
-    for func in sub_report_functions:
-        report_name = func.__name__.replace('sub_report_', '').replace('_', ' ').title()
+def _run_fetcher(fetch, report_dates, metrics, snapshot=None):
+    name = fetch.__name__.replace('fetch_', '').replace('_range', '')
+    with bind_snapshot(snapshot), bind_metrics(metrics, "fetchers", name), metric_timer("fetch_s"):
+        return fetch(report_dates)
+
+async def _run_fetcher_async(fetch, report_dates, metrics, snapshot=None):
+    name = fetch.__name__.replace('fetch_', '').replace('_range', '')
+    with bind_snapshot(snapshot), bind_metrics(metrics, "fetchers", name), metric_timer("fetch_s"):
+        async_fetch = ASYNC_FETCHERS.get(fetch)
+        if async_fetch is None:
+            # Fetchers without an async version run in a thread
+            return await asyncio.to_thread(fetch, report_dates)
+        return await async_fetch(report_dates)
+
+def _section_fetchers(sub_report_functions):
+    """Sections that have a data fetcher, and their distinct fetchers in order."""
+    sections = [func for func in sub_report_functions if func in SECTION_FETCHERS]
+    fetchers = []
+    for func in sections:
+        fetch = SECTION_FETCHERS[func][0]
+        if fetch not in fetchers:
+            fetchers.append(fetch)
+    return sections, fetchers
+
+def _section_data_by_date(sections, results, report_dates):
+    section_data = {d: {} for d in report_dates}
+    for d in report_dates:
+        for func in sections:
+            fetch, key = SECTION_FETCHERS[func]
+            data = results[fetch]
+            if not isinstance(data, Exception):
+                data = data[d] if key is None else data[d][key]
+            section_data[d][func] = data
+    return section_data
+
+def fetch_sections_range(sub_report_functions, report_dates, max_workers=FETCH_WORKERS, metrics=None):
+    """Runs the queries of every section concurrently for all report_dates at once.
+
+    Returns {report_date: {sub_report_function: data}}, where data is the exception raised
+    while fetching it if the section's fetcher failed. Query timings, row counts and
+    bytes are recorded per fetcher into metrics, when given. All queries read the same
+    database snapshot (see RunSnapshot) unless REPORT_SNAPSHOT=0. With REPORT_ASYNC_DB=1
+    they are awaited on the report's event loop instead of one thread per fetcher.
+    """
+    if ASYNC_DB:
+        if async_db_available():
+            return run_async(fetch_sections_range_async(sub_report_functions, report_dates, metrics))
+        print(f"Async database path needs greenlet and {ASYNC_DRIVER}: using threads")
+
+    sections, fetchers = _section_fetchers(sub_report_functions)
+    if not fetchers:
+        return {d: {} for d in report_dates}
+
+    start = time.perf_counter()
+    results = {}
+    snapshot = RunSnapshot() if SNAPSHOT_ENABLED else None
+    try:
+        with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(fetchers)))) as executor:
+            futures = {executor.submit(_run_fetcher, fetch, report_dates, metrics, snapshot): fetch for fetch in fetchers}
+            for future in as_completed(futures):
+                fetch = futures[future]
+                try:
+                    results[fetch] = future.result()
+                except Exception as e:
+                    print(f"Error in data fetcher '{fetch.__name__}': {str(e)}")
+                    results[fetch] = e
+    finally:
+        if snapshot is not None:
+            snapshot.close()
+    elapsed = time.perf_counter() - start
+    if metrics is not None:
+        metrics.add("run", None, fetch_s=elapsed)
+    print(f"Fetched data for {len(sections)} sections ({len(fetchers)} fetchers) "
+          f"and {len(report_dates)} dates in {elapsed:.2f}s")
+    return _section_data_by_date(sections, results, report_dates)
+
+async def fetch_sections_range_async(sub_report_functions, report_dates, metrics=None):
+    """fetch_sections_range on the async engine: every section query in flight from one loop."""
+    sections, fetchers = _section_fetchers(sub_report_functions)
+    if not fetchers:
+        return {d: {} for d in report_dates}
+
+    start = time.perf_counter()
+    snapshot = AsyncRunSnapshot() if SNAPSHOT_ENABLED else None
+    try:
+        outcomes = await asyncio.gather(
+            *(_run_fetcher_async(fetch, report_dates, metrics, snapshot) for fetch in fetchers),
+            return_exceptions=True,
+        )
+    finally:
+        if snapshot is not None:
+            await snapshot.close()
+    results = {}
+    for fetch, outcome in zip(fetchers, outcomes):
+        if isinstance(outcome, Exception):
+            print(f"Error in data fetcher '{fetch.__name__}': {str(outcome)}")
+        results[fetch] = outcome
+    elapsed = time.perf_counter() - start
+    if metrics is not None:
+        metrics.add("run", None, fetch_s=elapsed)
+    print(f"Fetched data for {len(sections)} sections ({len(fetchers)} fetchers) "
+          f"and {len(report_dates)} dates in {elapsed:.2f}s (async)")
+    return _section_data_by_date(sections, results, report_dates)
+
+def fetch_sections_data(sub_report_functions, report_date, max_workers=FETCH_WORKERS, metrics=None):
+    """Runs the queries of every section concurrently for a single date.
+
+    Returns a dict mapping each sub-report function that has a fetcher to its data,
+    or to the exception raised while fetching it.
+    """
+    return fetch_sections_range(sub_report_functions, [report_date], max_workers, metrics)[report_date]
+
+@contextmanager
+def run_workspace(parent_dir=None):
+    """Private scratch directory for one report run, removed when the run ends.
+
+    Created next to the output by default, so finished files can be moved into place
+    atomically with os.replace.
+    """
+    workspace = tempfile.mkdtemp(prefix=".reporte_fci_", dir=parent_dir)
+    try:
+        yield workspace
+    finally:
+        shutil.rmtree(workspace, ignore_errors=True)
+
+def generate_multi_report_pdf(output_file, sub_report_functions, report_date, section_data=None, render_workers=None,
+                              export_formats=None):
+    """Generate a PDF with multiple sub-reports.
+
+    The PDF is built inside a private workspace and only replaces output_file once it is
+    complete, so concurrent runs (including two runs for the same date) never see each
+    other's partial files. section_data, as returned by fetch_sections_data, skips the
+    fetch phase when given. render_workers overrides REPORT_RENDER_WORKERS and
+    export_formats REPORT_EXPORT: the section datasets are also written in those formats,
+    from the same fetched data.
+    """
+    start = time.perf_counter()
+    metrics = RunMetrics(report_date)
+    export_formats = EXPORT_FORMATS if export_formats is None else export_formats
+    if export_formats and section_data is None:
+        section_data = fetch_sections_data(sub_report_functions, report_date, metrics=metrics)
+    output_dir = os.path.dirname(os.path.abspath(output_file))
+    with run_workspace(output_dir) as workspace:
+        build_file = os.path.join(workspace, os.path.basename(output_file))
+        built = _build_multi_report_pdf(build_file, sub_report_functions, report_date, section_data, metrics,
+                                        render_workers)
+        if export_formats:
+            export_start = time.perf_counter()
+            for path in export_datasets(build_file, section_datasets(sub_report_functions, section_data), export_formats):
+                os.replace(path, os.path.join(output_dir, os.path.basename(path)))
+                print(f"Exported: {os.path.join(output_dir, os.path.basename(path))}")
+            metrics.set(export_s=time.perf_counter() - export_start)
+        metrics.set(output=output_file, ok=built, total_s=time.perf_counter() - start)
+        if built:
+            os.replace(build_file, output_file)
+            print(f"Multi-report PDF generated: {output_file}")
         try:
-            print(f"Generating sub-report: {report_name}")
-            sub_elements = func(report_date)  # Pass report_date to sub-reports
-            if sub_elements:
-                all_elements.extend(sub_elements)
-                print(f"{report_name}: Elements added ({len(sub_elements)}): {[type(e).__name__ for e in sub_elements]}")
-                for elem in sub_elements:
-                    if isinstance(elem, Paragraph) and "Fecha:" in elem.text:
-                        fecha_match = re.search(r"Fecha: (\S+)", elem.text)
-                        if fecha_match:
-                            doc.fecha_value = fecha_match.group(1)
-                            print(f"{report_name}: Set doc.fecha_value to {doc.fecha_value}")
-                            break
-                    if isinstance(elem, Image):
-                        image_paths.append(elem.filename)
+            metrics_file = os.path.join(workspace, os.path.basename(metrics_filename(output_file)))
+            metrics.write_jsonl(metrics_file)
+            os.replace(metrics_file, metrics_filename(output_file))
         except Exception as e:
-            print(f"Error in sub-report '{report_name}': {str(e)}")
-            styles = getSampleStyleSheet()
-            error_style = styles['Normal']
-            error_style.fontName = 'MS Sans Serif'
-            all_elements.append(Paragraph(f"Error in {report_name}: {str(e)}", error_style))
-            all_elements.append(PageBreak())
+            print(f"Could not write metrics: {str(e)}")
+    return built
+
+def _section_elements(func, report_date, section_data, metrics=None):
+    """Builds the flowables of one sub-report, or an error page if its data or builder failed.
+
+    Returns (elements, ok).
+    """
+    report_name = func.__name__.replace('sub_report_', '').replace('_', ' ').title()
+    try:
+        print(f"Generating sub-report: {report_name}")
+        section_name = func.__name__.replace('sub_report_', '')
+        with bind_metrics(metrics, "sections", section_name), metric_timer("render_s"):
+            if func in section_data:
+                data = section_data[func]
+                if isinstance(data, Exception):
+                    raise data
+                sub_elements = func(report_date, data)
+            else:
+                sub_elements = func(report_date)  # Pass report_date to sub-reports
+        if sub_elements:
+            print(f"{report_name}: Elements added ({len(sub_elements)}): {[type(e).__name__ for e in sub_elements]}")
+        return sub_elements or [], True
+    except Exception as e:
+        print(f"Error in sub-report '{report_name}': {str(e)}")
+        return _error_elements(report_name, e), False
+
+def _error_elements(report_name, error):
+    # A style of its own: section_styles() is shared by every section of the process
+    error_style = ParagraphStyle('Error', parent=section_styles()['Normal'], fontName='MS Sans Serif')
+    return [Paragraph(f"Error in {report_name}: {str(error)}", error_style), PageBreak()]
+
+def _fecha_from_elements(elements):
+    """Date shown in the page header, taken from a section's "Fecha: ..." paragraph."""
+    for elem in elements:
+        if isinstance(elem, Paragraph) and "Fecha:" in elem.text:
+            fecha_match = re.search(r"Fecha: (\S+)", elem.text)
+            if fecha_match:
+                return fecha_match.group(1)
+    return None
+
+def _build_multi_report_pdf(output_file, sub_report_functions, report_date, section_data=None, metrics=None,
+                            render_workers=None):
+    """Builds the multi-report PDF at output_file. Returns True if a PDF was written."""
+    register_fonts()
+
+    # Fetch every section's data up front, then assemble in the original order
+    if section_data is None:
+        section_data = fetch_sections_data(sub_report_functions, report_date, metrics=metrics)
+
+    if FRAGMENTS_ENABLED:
+        try:
+            import pypdf  # noqa: F401
+        except ImportError:
+            print("pypdf is not installed: building the whole document in one pass")
+        else:
+            return _build_from_fragments(output_file, sub_report_functions, report_date, section_data, metrics,
+                                         render_workers)
+    return _build_single_pdf(output_file, sub_report_functions, report_date, section_data, metrics)
+
+def _build_single_pdf(output_file, sub_report_functions, report_date, section_data, metrics=None):
+    """Lays out every section in a single doc.build."""
+    doc = SimpleDocTemplate(output_file, pagesize=letter, **PAGE_MARGINS)
+    all_elements = []
+    for func in sub_report_functions:
+        sub_elements, _ = _section_elements(func, report_date, section_data, metrics)
+        all_elements.extend(sub_elements)
+        fecha_value = _fecha_from_elements(sub_elements)
+        if fecha_value:
+            doc.fecha_value = fecha_value
+            print(f"Set doc.fecha_value to {doc.fecha_value}")
 
     print("All elements:", len(all_elements), [type(e).__name__ for e in all_elements])
+    build_start = time.perf_counter()
     try:
         doc.build(all_elements, onFirstPage=add_header_footer, onLaterPages=add_header_footer)
-        print(f"Multi-report PDF generated: {output_file}")
+        if metrics is not None:
+            metrics.set(build_s=time.perf_counter() - build_start, pages=doc.page)
+        return True
     except Exception as e:
         print(f"Error during PDF build: {str(e)}")
         safe_types = (Paragraph, Table, Spacer, PageBreak, Image)
@@ -527,262 +1960,1078 @@ def generate_multi_report_pdf(output_file, sub_report_functions, report_date):
         if safe_elements:
             try:
                 doc.build(safe_elements, onFirstPage=add_header_footer, onLaterPages=add_header_footer)
-                print(f"Minimal PDF generated: {output_file}")
+                print("Minimal PDF generated")
+                return True
             except Exception as e2:
                 print(f"Minimal build failed: {str(e2)}")
         else:
             print("No safe elements to build PDF")
-
-    for path in image_paths:
-        if os.path.exists(path):
+    return False
+
+_layout_version = None
+
+def layout_version():
+    """Fingerprint of the code that lays out fragments: this module and reportlab."""
+    global _layout_version
+    if _layout_version is None:
+        import reportlab
+        with open(os.path.abspath(__file__), "rb") as file:
+            _layout_version = hashlib.sha256(file.read() + reportlab.Version.encode()).hexdigest()[:16]
+    return _layout_version
+
+def fragment_key(func, report_date, data):
+    """Cache key of a section fragment: its builder, date and data plus the layout version."""
+    payload = pickle.dumps((func.__name__, report_date, data), protocol=pickle.HIGHEST_PROTOCOL)
+    return hashlib.sha256(layout_version().encode() + payload).hexdigest()
+
+def render_fragment(path, elements, fecha_value=None):
+    """Lays out elements as a standalone PDF with the report's page geometry and no page furniture.
+
+    The header date found in the section is kept as the PDF subject, so a cached
+    fragment can still provide it.
+    """
+    tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    try:
+        doc = SimpleDocTemplate(tmp_path, pagesize=letter, subject=fecha_value or "", **PAGE_MARGINS)
+        doc.build(elements)
+        os.replace(tmp_path, path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+def _fragment_path(func, report_date, section_data, workspace):
+    """Returns (path, cacheable) for func's fragment: in the fragment cache, or in workspace."""
+    data = section_data.get(func)
+    if CACHE_ENABLED and not isinstance(data, Exception):
+        return os.path.join(FRAGMENT_DIR, f"{fragment_key(func, report_date, data)}.pdf"), True
+    return os.path.join(workspace, f"{func.__name__.replace('sub_report_', '')}.pdf"), False
+
+def _render_section_fragment(func, report_date, section_data, path, cacheable, workspace):
+    """Lays out one section into its fragment; runs in render worker processes too.
+
+    Returns (path, section_metrics). Error pages go to workspace instead of the cache,
+    so the next run tries the section again.
+    """
+    register_fonts()
+    section_name = func.__name__.replace('sub_report_', '')
+    metrics = RunMetrics(report_date)
+    elements, ok = _section_elements(func, report_date, section_data, metrics)
+    failed_path = os.path.join(workspace, f"{section_name}.pdf")
+    with bind_metrics(metrics, "sections", section_name), metric_timer("layout_s"):
+        try:
+            render_fragment(path if ok else failed_path, elements, _fecha_from_elements(elements))
+        except Exception as e:
+            report_name = section_name.replace('_', ' ').title()
+            print(f"Error during PDF build of '{report_name}': {str(e)}")
+            ok = False
+            render_fragment(failed_path, _error_elements(report_name, e))
+    if not ok:
+        return failed_path, metrics.sections.get(section_name, {})
+    return path, metrics.sections.get(section_name, {})
+
+def merge_fragments(output_file, fragment_paths):
+    """Concatenates fragments into output_file and stamps the page furniture on every page.
+
+    Logo, header date, footer and "Página N" are drawn by add_header_footer on a separate
+    canvas and merged beneath each page's content, as onPage would have drawn them.
+    Returns the number of pages.
+    """
+    from pypdf import PdfReader, PdfWriter
+    writer = PdfWriter()
+    fecha_value = None
+    for path in fragment_paths:
+        reader = PdfReader(path)
+        subject = (reader.metadata or {}).get("/Subject")
+        if subject:
+            fecha_value = subject
+        writer.append(reader)
+
+    furniture = io.BytesIO()
+    canvas = Canvas(furniture, pagesize=letter)
+    doc = SimpleNamespace(fecha_value=fecha_value or 'N/A', page=0)
+    for doc.page in range(1, len(writer.pages) + 1):
+        add_header_footer(canvas, doc)
+        canvas.showPage()
+    canvas.save()
+    for page, background in zip(writer.pages, PdfReader(furniture).pages):
+        page.merge_page(background, over=False)
+        page.compress_content_streams()  # merge_page leaves the combined stream uncompressed
+    writer.compress_identical_objects()  # Fonts and images repeated across fragments
+
+    with open(output_file, "wb") as file:
+        writer.write(file)
+    return len(writer.pages)
+
+def _page_groups(elements):
+    """Splits flowables after each PageBreak, so every group starts on a fresh page."""
+    groups, current = [], []
+    for elem in elements:
+        current.append(elem)
+        if isinstance(elem, PageBreak):
+            groups.append(current)
+            current = []
+    if current:
+        groups.append(current)
+    return groups
+
+def _layout_part(path, elements, fecha_value):
+    """Lays out part of a section in a render worker. Returns the seconds it took."""
+    register_fonts()
+    start = time.perf_counter()
+    render_fragment(path, elements, fecha_value)
+    return time.perf_counter() - start
+
+def _render_fragments_parallel(pending, report_date, section_data, workspace, render_workers, collect):
+    """Lays out the pending fragments across render_workers processes.
+
+    Sections are built here, then split into page groups (at their PageBreaks) spread in
+    contiguous parts over the workers, so a long section like rentabilidades is laid out
+    by several cores at once. Each section's parts are then joined into its fragment.
+    collect(func, (path, section_metrics)) receives every finished fragment.
+    """
+    from pypdf import PdfWriter
+    targets = {func: (path, cacheable) for func, path, cacheable in pending}
+    sections = []
+    for func, path, cacheable in pending:
+        section_name = func.__name__.replace('sub_report_', '')
+        metrics = RunMetrics(report_date)
+        elements, ok = _section_elements(func, report_date, section_data, metrics)
+        if not ok:
+            path, cacheable = os.path.join(workspace, f"{section_name}.pdf"), False
+        sections.append((func, path, cacheable, _page_groups(elements), _fecha_from_elements(elements), metrics))
+
+    part_size = max(1, -(-sum(len(groups) for *_, groups, _, _ in sections) // render_workers))
+    with ProcessPoolExecutor(max_workers=render_workers) as executor:
+        futures = []
+        for func, path, cacheable, groups, fecha_value, metrics in sections:
+            parts = []
+            for n, first in enumerate(range(0, len(groups), part_size)):
+                part_path = os.path.join(workspace, f"{func.__name__}.part{n}.pdf")
+                part_elements = [elem for group in groups[first:first + part_size] for elem in group]
+                parts.append((part_path, executor.submit(_layout_part, part_path, part_elements, fecha_value)))
+            futures.append((func, path, cacheable, groups, fecha_value, metrics, parts))
+
+        for func, path, cacheable, groups, fecha_value, metrics, parts in futures:
+            section_name = func.__name__.replace('sub_report_', '')
             try:
-                os.remove(path)
-                print(f"Cleaned up: {path}")
+                layout_s = sum(future.result() for _, future in parts)
+                metrics.add("sections", section_name, layout_s=layout_s)
+                if len(parts) == 1:
+                    os.replace(parts[0][0], path)
+                else:
+                    writer = PdfWriter()
+                    for part_path, _ in parts:
+                        writer.append(part_path)
+                    writer.add_metadata({"/Subject": fecha_value or ""})
+                    tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+                    with open(tmp_path, "wb") as file:
+                        writer.write(file)
+                    os.replace(tmp_path, path)
+                collect(func, (path, metrics.sections.get(section_name, {})))
             except Exception as e:
-                print(f"Failed to clean up {path}: {str(e)}")
+                # A part failed or could not be sent to a worker: lay the section out here
+                print(f"Parallel layout failed for '{section_name}': {str(e)}")
+                path, cacheable = targets[func]
+                collect(func, _render_section_fragment(func, report_date, section_data, path, cacheable, workspace))
+
+def _build_from_fragments(output_file, sub_report_functions, report_date, section_data, metrics=None,
+                          render_workers=None):
+    """Builds each section as its own PDF fragment, reusing cached ones, and merges them.
+
+    Fragments hold only the section's content; page furniture and page numbers are added
+    when merging, so a fragment does not depend on its position in the report and stays
+    valid until its data or the layout code changes. With render_workers > 1 the missing
+    fragments are laid out in parallel worker processes.
+    """
+    render_workers = RENDER_WORKERS if render_workers is None else render_workers
+    workspace = os.path.dirname(os.path.abspath(output_file))
+    if not CACHE_ENABLED:
+        return _merge_run_fragments(output_file, sub_report_functions, report_date, section_data,
+                                    workspace, None, metrics, render_workers)
+    os.makedirs(FRAGMENT_DIR, exist_ok=True)
+    # The run merges its fragments from a private directory, so neither its own eviction
+    # nor a concurrent run's can remove a fragment between choosing and merging it
+    pinned = tempfile.mkdtemp(prefix="run-", dir=FRAGMENT_DIR)
+    try:
+        return _merge_run_fragments(output_file, sub_report_functions, report_date, section_data,
+                                    workspace, pinned, metrics, render_workers)
+    finally:
+        shutil.rmtree(pinned, ignore_errors=True)
+        try:
+            _remove_stale_runs()
+            _evict_disk_cache(FRAGMENT_DIR, ".pdf")
+        except Exception as e:
+            print(f"Cache: could not evict fragments: {str(e)}")
+
+def _remove_stale_runs():
+    """Removes the run-* directories under FRAGMENT_DIR untouched for STALE_RUN_SECONDS.
+
+    A run removes its own directory when it ends; these are left by runs that crashed or
+    were killed, and would otherwise keep their hard-linked fragments on disk for good.
+    """
+    cutoff = time.time() - STALE_RUN_SECONDS
+    with os.scandir(FRAGMENT_DIR) as it:
+        for entry in it:
+            if not (entry.name.startswith("run-") and entry.is_dir(follow_symlinks=False)):
+                continue
+            try:
+                if entry.stat(follow_symlinks=False).st_mtime < cutoff:
+                    shutil.rmtree(entry.path, ignore_errors=True)
+            except FileNotFoundError:
+                pass
+
+def _pin_fragment(path, pinned_path):
+    """Links a cached fragment into the run's directory (copies it without hard links).
+
+    Returns False if the fragment is not cached (anymore).
+    """
+    try:
+        os.link(path, pinned_path)
+    except FileNotFoundError:
+        return False
+    except OSError:
+        try:
+            shutil.copyfile(path, pinned_path)
+        except FileNotFoundError:
+            return False
+    return True
+
+def _merge_run_fragments(output_file, sub_report_functions, report_date, section_data, workspace,
+                         pinned, metrics, render_workers):
+    """Reuses or renders every section's fragment and merges them (see _build_from_fragments).
+
+    Cacheable fragments live in pinned during the run and are published to the fragment
+    cache afterwards; without pinned (cache disabled) everything goes to workspace.
+    """
+    fragments, pending, published = {}, [], {}
+    for func in sub_report_functions:
+        path, cacheable = _fragment_path(func, report_date, section_data, workspace)
+        if cacheable:
+            pinned_path = os.path.join(pinned, os.path.basename(path))
+            if _pin_fragment(path, pinned_path):
+                try:
+                    os.utime(path)  # Eviction drops the least recently used fragments first
+                except FileNotFoundError:
+                    pass
+                print(f"{func.__name__.replace('sub_report_', '')}: reusing cached fragment")
+                fragments[func] = pinned_path
+                continue
+            published[pinned_path] = path
+            path = pinned_path
+        pending.append((func, path, cacheable))
+    reused = len(fragments)
+
+    def collect(func, result):
+        path, section_metrics = result
+        fragments[func] = path
+        if metrics is not None and section_metrics:
+            metrics.add("sections", func.__name__.replace('sub_report_', ''), **section_metrics)
+
+    if render_workers > 1 and pending:
+        _render_fragments_parallel(pending, report_date, section_data, workspace, render_workers, collect)
+    else:
+        for func, path, cacheable in pending:
+            collect(func, _render_section_fragment(func, report_date, section_data, path, cacheable, workspace))
 
-def get_report_date():
+    build_start = time.perf_counter()
+    try:
+        pages = merge_fragments(output_file, [fragments[func] for func in sub_report_functions])
+    except Exception as e:
+        print(f"Error merging PDF fragments: {str(e)}")
+        return False
+    finally:
+        # Newly rendered fragments join the cache once the run no longer needs them
+        for path in fragments.values():
+            if path in published:
+                try:
+                    os.replace(path, published[path])
+                except OSError as e:
+                    print(f"Cache: could not store fragment: {str(e)}")
+    if metrics is not None:
+        metrics.set(build_s=time.perf_counter() - build_start, pages=pages, fragments_reused=reused)
+    print(f"Merged {len(fragments)} fragments ({reused} reused) into {pages} pages")
+    return True
+
+LATEST_DATE_QUERY = text("SELECT MAX(fecha_imputada) FROM fci_diaria_2")
+
+# Tables the report maintains itself (see refresh_known_funds and refresh_daily_totals)
+_ready_tables = set()
+
+def derived_table_ready(table):
+    """Whether a table the report maintains exists; checked against the catalog until it does."""
+    if table not in _ready_tables:
+        with get_engine().connect() as connection:
+            if connection.execute(text("SELECT to_regclass(:table) IS NOT NULL"), {"table": table}).scalar():
+                _ready_tables.add(table)
+    return table in _ready_tables
+
+def _derived_hasta_query(table):
+    return text(f"SELECT hasta FROM {table}")
+
+def derived_table_hasta(table):
+    """Last date folded into a table the report maintains, read in the run's snapshot.
+
+    Passed to the section queries as a parameter: as a subquery the planner cannot use it
+    to pick an index range over the source tables.
+    """
+    rows = run_query(_derived_hasta_query(table))
+    return rows[0][0] if rows else None
+
+async def derived_table_hasta_async(table):
+    rows = await run_query_async(_derived_hasta_query(table))
+    return rows[0][0] if rows else None
+
+def _refresh_desde(connection, table):
+    """First date a refresh of a table the report maintains re-checks: REFRESH_WINDOW_DAYS
+    before its last folded-in date, or None (the whole history) on the first refresh."""
+    hasta = connection.execute(_derived_hasta_query(table)).scalar()
+    if hasta is None or REFRESH_WINDOW_DAYS < 0:
+        return None
+    return hasta - timedelta(days=REFRESH_WINDOW_DAYS)
+
+# A date is complete once the daily table and every table the sections read from have it
+REPORT_DATE_SOURCES = ("fci_diaria_2", "efectos_intertemp_pesos", "efectos_intertemp",
+                       "efectos_base", "efectos_base_pesos", "report_aum_familia_2")
+
+# LEAST skips NULLs, so an empty table does not hold the date back; each MAX is answered
+# from an index on fecha_imputada where there is one
+COMPLETE_DATE_QUERY = text("SELECT LEAST({})".format(", ".join(
+    f"(SELECT MAX(fecha_imputada) FROM {table})" for table in REPORT_DATE_SOURCES)))
+
+DATE_WATERMARK_DDL = text("""
+    CREATE TABLE IF NOT EXISTS report_fecha_watermark (
+        id boolean PRIMARY KEY DEFAULT true CHECK (id),
+        fecha_imputada date NOT NULL,
+        fuentes text,
+        actualizado timestamptz NOT NULL DEFAULT now()
+    )
+""")
+
+READ_DATE_WATERMARK_QUERY = text("SELECT fecha_imputada, fuentes FROM report_fecha_watermark")
+
+UPSERT_DATE_WATERMARK_QUERY = text("""
+    INSERT INTO report_fecha_watermark (id, fecha_imputada, fuentes, actualizado)
+    VALUES (true, :fecha, :fuentes, now())
+    ON CONFLICT (id) DO UPDATE
+    SET fecha_imputada = EXCLUDED.fecha_imputada, fuentes = EXCLUDED.fuentes, actualizado = now()
+""")
+
+def _date_sources_fingerprint(connection):
+    """Digest of the change log watermark of REPORT_DATE_SOURCES in connection's
+    transaction, or None if they are not all logged."""
+    watermark = source_watermark(REPORT_DATE_SOURCES, read_change_log(connection))
+    if watermark is None:
+        return None
+    return hashlib.sha256(repr(watermark).encode()).hexdigest()
+
+def _date_sources_connection():
+    """A REPEATABLE READ connection, so the fingerprint and the date it is compared with
+    (or computed alongside) describe the same committed state."""
+    return get_engine().connect().execution_options(isolation_level="REPEATABLE READ")
+
+def refresh_report_date_watermark():
+    """Recomputes the latest complete date and stores it in report_fecha_watermark.
+
+    Returns the date as an ISO string, or None if it could not be computed. Failing to
+    store it (e.g. a read-only role) only costs the recomputation on the next run.
+    """
+    try:
+        with _date_sources_connection() as connection:
+            fingerprint = _date_sources_fingerprint(connection)
+            fecha = connection.execute(COMPLETE_DATE_QUERY).scalar()
+    except Exception as e:
+        print(f"Report date: could not compute the latest complete date: {str(e)}")
+        return None
+    if fecha is None:
+        return None
+
+    try:
+        with get_engine().begin() as connection:
+            connection.execute(DATE_WATERMARK_DDL)
+            connection.execute(UPSERT_DATE_WATERMARK_QUERY, {"fecha": fecha, "fuentes": fingerprint})
+        print(f"Report date: watermark set to {fecha.isoformat()}")
+    except Exception as e:
+        print(f"Report date: could not store the watermark: {str(e)}")
+    return fecha.isoformat()
+
+def report_date_from_watermark():
+    """Latest complete report date, read from report_fecha_watermark.
+
+    The stored date is trusted while the change log of its source tables is the one it
+    was computed from; otherwise (or if the table does not exist yet) it is recomputed
+    and stored. Returns None if neither works.
+    """
+    row = fingerprint = None
+    try:
+        with _date_sources_connection() as connection:
+            fingerprint = _date_sources_fingerprint(connection)
+            if connection.execute(text("SELECT to_regclass('report_fecha_watermark') IS NOT NULL")).scalar():
+                row = connection.execute(READ_DATE_WATERMARK_QUERY).first()
+    except Exception as e:
+        print(f"Report date: could not read the watermark: {str(e)}")
+    if row is not None and fingerprint is not None and row[1] == fingerprint:
+        return row[0].isoformat()
+    return refresh_report_date_watermark()
+
+def get_report_date(date_arg=None):
     """Get report date from command-line argument or database."""
-    if len(sys.argv) > 1:
+    if date_arg:
         try:
-            report_date = datetime.strptime(sys.argv[1], '%Y-%m-%d').date().isoformat()
+            report_date = datetime.strptime(date_arg, '%Y-%m-%d').date().isoformat()
             print(f"Using report date from argument: {report_date}")
             return report_date
         except ValueError:
-            print(f"Invalid date format in argument '{sys.argv[1]}'. Fetching from database.")
-    
-    # Fetch max date from fci_diaria_2
-    with engine.connect() as connection:
-        query = text("SELECT MAX(fecha_imputada) FROM fci_diaria_2")
-        result = connection.execute(query).scalar()
-        report_date = result.isoformat() if result else '2025-03-13'  # Fallback
-        print(f"Using report date from database: {report_date}")
+            print(f"Invalid date format in argument '{date_arg}'. Fetching from database.")
+
+    report_date = report_date_from_watermark()
+    if report_date:
+        print(f"Using latest complete report date: {report_date}")
         return report_date
 
-def sub_report_efec_categoria(report_date):
-    """Generates a sub-report with net subscription effects by category."""
+    if ASYNC_DB and async_db_available():
+        return run_async(get_report_date_async())
+
+    # Fall back to the max date in fci_diaria_2
+    with get_engine().connect() as connection:
+        return _report_date_from(connection.execute(LATEST_DATE_QUERY).scalar())
+
+async def get_report_date_async():
+    """Latest report date in the database, awaited on the async engine."""
+    async with get_async_engine().connect() as connection:
+        return _report_date_from(await connection.scalar(LATEST_DATE_QUERY))
+
+def _report_date_from(result):
+    report_date = result.isoformat() if result else '2025-03-13'  # Fallback
+    print(f"Using report date from database: {report_date}")
+    return report_date
+
+RENTABILIDADES_SOURCES = ("vista_rentabilidades",)
+
+RENTABILIDADES_QUERY = text("""
+    SELECT fecha_imputada AS fecha, 
+           fondo,
+           patrimonio,
+           categoria,
+           "subCategoria",
+           rent_vcp_1d AS "1D",
+           rent_vcp_wtd AS "WTD",
+           rent_vcp_mtd AS "MTD",
+           rent_vcp_1m AS "1M",
+           rent_vcp_3m AS "3M",
+           rent_vcp_ytd AS "YTD",
+           rent_vcp_1y AS "1Y"
+    FROM vista_rentabilidades
+    WHERE fecha_imputada BETWEEN :date_from AND :date_to
+      AND categoria NOT IN ('?', 'Cáscara', 'Basura')
+    ORDER BY fecha, categoria, "subCategoria", "1D", "WTD", "1M"
+""")
+
+FONDOS_SIN_CLASIFICAR_SOURCES = ("fci_diaria_2", "clasesFCI")
+
+# Full scan, used until the known-funds tables exist
+FONDOS_SIN_CLASIFICAR_SCAN_QUERY = text("""
+    SELECT DISTINCT f.fondo
+    FROM fci_diaria_2 f
+    LEFT JOIN "clasesFCI" c
+        ON f.fondo = c.fondo
+    WHERE c.fondo IS NULL
+        OR c.familia IS NULL
+        OR c.categoria IS NULL
+        OR c."subCategoria" IS NULL;
+""")
+
+# Every fund seen in fci_diaria_2, kept up to date incrementally: report_fondos_conocidos_fechas
+# holds a fingerprint (row count and sum of fund name hashes) of every date already folded in,
+# so a refresh only reads the funds of dates that are new or changed since, including rows
+# backfilled for recent dates. Only dates from :desde on are fingerprinted, an index range
+# on fci_diaria_2. report_fondos_conocidos_estado holds the last folded-in date.
+KNOWN_FUNDS_DDL = (
+    text("""
+        CREATE TABLE IF NOT EXISTS report_fondos_conocidos (
+            fondo text PRIMARY KEY,
+            primera_fecha date
+        )
+    """),
+    text("""
+        CREATE TABLE IF NOT EXISTS report_fondos_conocidos_estado (
+            id boolean PRIMARY KEY DEFAULT true CHECK (id),
+            hasta date,
+            actualizado timestamptz NOT NULL DEFAULT now()
+        )
+    """),
+    text("""
+        CREATE TABLE IF NOT EXISTS report_fondos_conocidos_fechas (
+            fecha_imputada date PRIMARY KEY,
+            filas bigint NOT NULL,
+            huella bigint NOT NULL
+        )
+    """),
+)
+
+KNOWN_FUNDS_HASTA = "COALESCE(CAST(:hasta AS date), '-infinity'::date)"
+
+KNOWN_FUNDS_DESDE = "COALESCE(CAST(:desde AS date), '-infinity'::date)"
+
+REFRESH_KNOWN_FUNDS_QUERY = text(f"""
+    WITH actuales AS (
+        SELECT fecha_imputada, COUNT(*) AS filas, SUM(hashtext(fondo)) AS huella
+        FROM fci_diaria_2
+        WHERE fecha_imputada >= {KNOWN_FUNDS_DESDE}
+        GROUP BY fecha_imputada
+    ),
+    cambiadas AS (
+        SELECT a.fecha_imputada, a.filas, a.huella
+        FROM actuales a
+        LEFT JOIN report_fondos_conocidos_fechas k ON k.fecha_imputada = a.fecha_imputada
+        WHERE (k.filas, k.huella) IS DISTINCT FROM (a.filas, a.huella)
+    ),
+    fondos AS (
+        INSERT INTO report_fondos_conocidos (fondo, primera_fecha)
+        SELECT f.fondo, MIN(f.fecha_imputada)
+        FROM fci_diaria_2 f
+        JOIN cambiadas c ON c.fecha_imputada = f.fecha_imputada
+        WHERE f.fecha_imputada >= {KNOWN_FUNDS_DESDE}
+        GROUP BY f.fondo
+        ON CONFLICT (fondo) DO UPDATE
+        SET primera_fecha = LEAST(report_fondos_conocidos.primera_fecha, EXCLUDED.primera_fecha)
+    ),
+    borradas AS (
+        DELETE FROM report_fondos_conocidos_fechas k
+        WHERE k.fecha_imputada >= {KNOWN_FUNDS_DESDE}
+            AND NOT EXISTS (SELECT 1 FROM actuales a WHERE a.fecha_imputada = k.fecha_imputada)
+    )
+    INSERT INTO report_fondos_conocidos_fechas (fecha_imputada, filas, huella)
+    SELECT fecha_imputada, filas, huella FROM cambiadas
+    ON CONFLICT (fecha_imputada) DO UPDATE SET filas = EXCLUDED.filas, huella = EXCLUDED.huella
+""")
+
+KNOWN_FUNDS_STATE_QUERY = text("""
+    INSERT INTO report_fondos_conocidos_estado (id, hasta, actualizado)
+    SELECT true, MAX(fecha_imputada), now()
+    FROM report_fondos_conocidos_fechas
+    ON CONFLICT (id) DO UPDATE SET hasta = EXCLUDED.hasta, actualizado = now()
+""")
+
+KNOWN_FUNDS_SOURCES = ("report_fondos_conocidos", "report_fondos_conocidos_estado", "fci_diaria_2", "clasesFCI")
+
+# The last folded-in date is read again (>=), so rows loaded late for that day still count
+FONDOS_SIN_CLASIFICAR_QUERY = text(f"""
+    WITH fondos AS (
+        SELECT fondo FROM report_fondos_conocidos
+        UNION
+        SELECT fondo FROM fci_diaria_2 WHERE fecha_imputada >= {KNOWN_FUNDS_HASTA}
+    )
+    SELECT f.fondo
+    FROM fondos f
+    LEFT JOIN "clasesFCI" c
+        ON f.fondo = c.fondo
+    WHERE c.fondo IS NULL
+        OR c.familia IS NULL
+        OR c.categoria IS NULL
+        OR c."subCategoria" IS NULL
+    ORDER BY f.fondo
+""")
+
+def refresh_known_funds():
+    """Folds the fci_diaria_2 dates that are new or changed since the last refresh into
+    report_fondos_conocidos.
+
+    The first call creates the tables and reads the whole history. Later ones fingerprint
+    the dates from REPORT_REFRESH_DAYS before the last folded-in one (one grouped count
+    over an index range) and only read the funds of the dates whose fingerprint changed,
+    so funds loaded late for a recent date are picked up too. Funds stay known once seen.
+    Returns False if the tables could not be created or updated (e.g. a read-only role).
+    """
+    start = time.perf_counter()
+    try:
+        with get_engine().begin() as connection:
+            for statement in KNOWN_FUNDS_DDL:
+                connection.execute(statement)
+            desde = _refresh_desde(connection, "report_fondos_conocidos_estado")
+            changed = connection.execute(REFRESH_KNOWN_FUNDS_QUERY, {"desde": desde}).rowcount
+            connection.execute(KNOWN_FUNDS_STATE_QUERY)
+            hasta = connection.execute(text("SELECT hasta FROM report_fondos_conocidos_estado")).scalar()
+    except Exception as e:
+        print(f"Known funds: could not refresh report_fondos_conocidos: {str(e)}")
+        return False
+    _ready_tables.add("report_fondos_conocidos_estado")
+    print(f"Known funds: folded {changed} new or changed dates, up to {hasta}, "
+          f"in {time.perf_counter() - start:.2f}s")
+    return True
+
+def fetch_fondos_sin_clasificar_range(report_dates):
+    """Fetches funds without classification (the same list applies to every date).
+
+    Only reads: rows loaded for dates before the last refresh count from the next
+    refresh_known_funds, which runs after the procedures (or with --refresh-tables).
+    """
+    if derived_table_ready("report_fondos_conocidos_estado"):
+        params = {"hasta": derived_table_hasta("report_fondos_conocidos_estado")}
+        data = run_query(FONDOS_SIN_CLASIFICAR_QUERY, params, sources=KNOWN_FUNDS_SOURCES,
+                         in_memory=False)
+    else:
+        data = run_query(FONDOS_SIN_CLASIFICAR_SCAN_QUERY, sources=FONDOS_SIN_CLASIFICAR_SOURCES,
+                         in_memory=False)
+    return {d: data for d in report_dates}
+
+async def fetch_fondos_sin_clasificar_range_async(report_dates):
+    if await asyncio.to_thread(derived_table_ready, "report_fondos_conocidos_estado"):
+        params = {"hasta": await derived_table_hasta_async("report_fondos_conocidos_estado")}
+        data = await run_query_async(FONDOS_SIN_CLASIFICAR_QUERY, params, sources=KNOWN_FUNDS_SOURCES,
+                                     in_memory=False)
+    else:
+        data = await run_query_async(FONDOS_SIN_CLASIFICAR_SCAN_QUERY, sources=FONDOS_SIN_CLASIFICAR_SOURCES,
+                                     in_memory=False)
+    return {d: data for d in report_dates}
+
+EFECTOS_COLUMNS = ["1D", "1SEM", "MTD", "1M", "3M", "YTD", "1Y"]
+
+# A table section, declared instead of written: where its rows come from, which fields
+# become which columns and how they look. table_section turns a spec into a sub-report.
+TableSpec = namedtuple("TableSpec", [
+    "name",      # short name, as in SUB_REPORTS_BY_NAME
+    "label",     # for the log lines and the "no data" message
+    "title",
+    "columns",   # (header, width, column formatter or None) for the row fields after skip
+    "fetch",     # (range fetcher, slice) as in SECTION_FETCHERS; None when query is given
+    "query",     # statement over :date_from/:date_to whose rows start with the fecha
+    "sources",   # tables behind query, for the result cache watermark
+    "skip",      # leading row fields left out of the table (the fecha)
+    "style",     # key into TABLE_STYLES
+    "paginate",  # pre-paginate into one table per page (see paginated_tables)
+    "dataset",   # (name, column names of the full rows) for the exports, or None
+], defaults=(None, None, (), 1, "normal", False, None))
+
+def _rows_by_date(rows, report_dates):
+    by_date = {d: [] for d in report_dates}
+    for row in rows:
+        date_rows = by_date.get(str(row[0]))
+        if date_rows is not None:
+            date_rows.append(row)
+    return by_date
+
+def query_fetchers(spec):
+    """Range fetcher and its async twin for a spec declared with a query.
+
+    The query runs once for the whole range of dates and its rows are grouped by their
+    first field.
+    """
+    def fetch(report_dates):
+        rows = run_query(spec.query, _date_range_params(report_dates), sources=spec.sources,
+                         in_memory=False)
+        return _rows_by_date(rows, report_dates)
+
+    async def fetch_async(report_dates):
+        rows = await run_query_async(spec.query, _date_range_params(report_dates), sources=spec.sources,
+                                     in_memory=False)
+        return _rows_by_date(rows, report_dates)
+
+    # Named like the hand-written fetchers, for the logs and metrics
+    fetch.__name__ = fetch.__qualname__ = f"fetch_{spec.name}_range"
+    fetch_async.__name__ = fetch_async.__qualname__ = f"fetch_{spec.name}_range_async"
+    return fetch, fetch_async
+
+def build_table_section(spec, report_date, data):
+    """Flowables of a table section: title, date, then the table (or one per page)."""
     elements = []
-    styles = getSampleStyleSheet()
-
-    # Query database with dynamic date
-    with engine.connect() as connection:
-        query = text("""
-            SELECT 
-                ei.fecha_imputada,
-                cf.categoria,
-                SUM(ROUND(ei.es_1d::numeric / 1e6, 0)) AS es_1d,
-                SUM(ROUND(ei.es_1w::numeric / 1e6, 0)) AS es_1w,
-                SUM(ROUND(ei.es_mtd::numeric / 1e6, 0)) AS es_mtd,
-                SUM(ROUND(ei.es_1m::numeric / 1e6, 0)) AS es_1m,
-                SUM(ROUND(ei.es_3m::numeric / 1e6, 0)) AS es_3m,
-                SUM(ROUND(ei.es_ytd::numeric / 1e6, 0)) AS es_ytd,
-                SUM(ROUND(ei.es_1y::numeric / 1e6, 0)) AS es_1y
-            FROM efectos_intertemp_pesos ei
-            JOIN "clasesFCI" cf ON ei.fondo = cf.fondo 
-                AND (ei.fecha_imputada BETWEEN cf.desde AND COALESCE(cf.hasta, CURRENT_DATE))
-            WHERE ei.fecha_imputada = :report_date
-            GROUP BY ei.fecha_imputada, cf.categoria
-            ORDER BY es_1d
-        """)
-        result = connection.execute(query, {"report_date": report_date})
-        data = result.fetchall()
+    styles = section_styles()
 
     if not data:
-        elements.append(Paragraph("No data available for Efectos Categoria report.", styles['Normal']))
+        elements.append(Paragraph(f"No data available for {spec.label} report.", styles['Normal']))
         elements.append(PageBreak())
         return elements
 
-    # Title
-    title = Paragraph("EFECTOS DE SUSCRIPCION NETOS POR CATEGORIA (en millones):", styles['Heading2'])
-    elements.append(title)
+    elements.append(Paragraph(spec.title, styles['Heading2']))
     elements.append(Spacer(1, 10))
     elements.append(Paragraph(f"Fecha: {report_date}", styles['Normal']))
     elements.append(Spacer(1, 5))
 
-    # Table (excluding fecha_imputada)
-    table_data = [["CATEGORIA", "1D", "1SEM", "MTD", "1M", "3M", "YTD", "1Y"]]
-    for row in data:
-        table_data.append([
-            row[1],  # categoria -> CATEGORIA
-            "{:,.0f}".format(row[2]).replace(",", "."),  # es_1d -> 1D
-            "{:,.0f}".format(row[3]).replace(",", "."),  # es_1w -> 1SEM
-            "{:,.0f}".format(row[4]).replace(",", "."),  # es_mtd -> MTD
-            "{:,.0f}".format(row[5]).replace(",", "."),  # es_1m -> 1M
-            "{:,.0f}".format(row[6]).replace(",", "."),  # es_3m -> 3M
-            "{:,.0f}".format(row[7]).replace(",", "."),  # es_ytd -> YTD
-            "{:,.0f}".format(row[8]).replace(",", ".")   # es_1y -> 1Y
-        ])
-    
-    table = Table(table_data, colWidths=[150, 50, 50, 50, 50, 50, 50, 50], hAlign='LEFT', repeatRows=1)
-    table.setStyle(TableStyle([
-        ('BACKGROUND', (0, 0), (-1, 0), colors.grey),
-        ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
-        ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
-        ('FONTNAME', (0, 0), (-1, -1), 'MS Sans Serif'),
-        ('FONTSIZE', (0, 0), (-1, -1), 8),
-        ('GRID', (0, 0), (-1, -1), 0.25, colors.black),
-        ('BOX', (0, 0), (-1, -1), 1, colors.black),
-    ]))
-    elements.append(table)
-    elements.append(PageBreak())
-    
-    print("Efectos Categoria: Table added")
-    return elements
-
-def sub_report_rentabilidades(report_date):
-    """Generates a sub-report with rentability data."""
-    elements = []
-    styles = getSampleStyleSheet()
-
-    # Query database
-    with engine.connect() as connection:
-        query = text("""
-            SELECT fecha_imputada AS fecha, 
-                   fondo,
-                   patrimonio,
-                   categoria,
-                   "subCategoria",
-                   rent_vcp_1d AS "1D",
-                   rent_vcp_wtd AS "WTD",
-                   rent_vcp_mtd AS "MTD",
-                   rent_vcp_1m AS "1M",
-                   rent_vcp_3m AS "3M",
-                   rent_vcp_ytd AS "YTD",
-                   rent_vcp_1y AS "1Y"
-            FROM vista_rentabilidades
-            WHERE fecha_imputada = :report_date
-              AND categoria NOT IN ('?', 'Cáscara', 'Basura')
-            ORDER BY categoria, "subCategoria", "1D", "WTD", "1M"
-        """)
-        result = connection.execute(query, {"report_date": report_date})
-        data = result.fetchall()
+    table_data = [[header for header, _, _ in spec.columns]]
+    formatters = {i: formatter for i, (_, _, formatter) in enumerate(spec.columns) if formatter}
+    table_data += format_table_rows(data, formatters, spec.skip)
+    col_widths = [width for _, width, _ in spec.columns]
+
+    if spec.paginate:
+        tables = paginated_tables(table_data, col_widths, TABLE_STYLES[spec.style],
+                                  # The heading opens a fresh page, where its spaceBefore is dropped
+                                  first_page_height=FRAME_HEIGHT - flowables_height(elements)
+                                  + elements[0].getSpaceBefore(),
+                                  **TABLE_ROW_METRICS[spec.style])
+    else:
+        tables = [Table(table_data, colWidths=col_widths, hAlign='LEFT', repeatRows=1)]
+        tables[0].setStyle(TABLE_STYLES[spec.style])
 
-    if not data:
-        elements.append(Paragraph("No data available for Rentabilidades report.", styles['Normal']))
+    # A break after each page table lets the layout be split by page (see _page_groups)
+    for table in tables:
+        elements.append(table)
         elements.append(PageBreak())
-        return elements
-
-    # Title
-    title = Paragraph("RENTABILIDADES VCP (en %):", styles['Heading2'])
-    elements.append(title)
-    elements.append(Spacer(1, 10))
-    elements.append(Paragraph(f"Fecha: {report_date}", styles['Normal']))
-    elements.append(Spacer(1, 5))
-
-    # Table header
-    headers = [
-        "FONDO", "PATRIMONIO", "CATEGORIA", "SUBCATEGORIA",
-        "1D", "WTD", "MTD", "1M", "3M", "YTD", "1Y"
-    ]
-    table_data = [headers]
 
-    for row in data:
-        row_values = [
-            row[1],  # fondo
-            f"{row[2]:,.0f}".replace(",", "."),  # patrimonio
-            row[3],  # categoria
-            row[4],  # subCategoria
-        ] + [f"{r * 100:.3f}%" if r is not None else "" for r in row[5:]]
-        table_data.append(row_values)
-
-    table = Table(
-        table_data,
-        colWidths=[127, 60, 60, 60, 35, 35, 35, 35, 35, 35, 35],
-        hAlign='LEFT',
-        repeatRows=1
-    )
-    table.setStyle(TableStyle([
-        ('BACKGROUND', (0, 0), (-1, 0), colors.grey),
-        ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
-        ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
-        ('FONTNAME', (0, 0), (-1, -1), 'MS Sans Serif'),
-        ('FONTSIZE', (0, 0), (-1, -1), 6),
-        ('LEADING', (0, 0), (-1, -1), 6),
-        ('TOPPADDING', (0, 0), (-1, -1), 0.5),
-        ('BOTTOMPADDING', (0, 0), (-1, -1), 0.6),
-        ('GRID', (0, 0), (-1, -1), 0.25, colors.black),
-        ('BOX', (0, 0), (-1, -1), 1, colors.black),
-    ]))
-
-    elements.append(table)
-    elements.append(PageBreak())
-
-    print("Rentabilidades: Table added")
+    print(f"{spec.label}: Table added")
     return elements
 
+def table_section(spec):
+    """The sub-report function for spec, named sub_report_<name>.
+
+    It must be assigned to that name at module level, so sections still pickle by
+    reference. The resolved spec and, for query specs, the async fetcher are kept on it.
+    """
+    fetch_async = None
+    if spec.query is not None:
+        fetch, fetch_async = query_fetchers(spec)
+        spec = spec._replace(fetch=(fetch, None))
+
+    def sub_report(report_date, data=None):
+        if data is None:
+            fetch, key = spec.fetch
+            data = fetch([report_date])[report_date]
+            if key is not None:
+                data = data[key]
+        return build_table_section(spec, report_date, data)
+
+    sub_report.__name__ = sub_report.__qualname__ = f"sub_report_{spec.name}"
+    sub_report.__doc__ = f"Generates the {spec.label} sub-report."
+    sub_report.spec = spec
+    sub_report.fetch_async = fetch_async
+    return sub_report
+
+sub_report_efec_categoria = table_section(TableSpec(
+    name="efec_categoria",
+    label="Efectos Categoria",
+    title="EFECTOS DE SUSCRIPCION NETOS POR CATEGORIA (en millones):",
+    columns=[("CATEGORIA", 150, None)] + [(header, 50, format_thousands) for header in EFECTOS_COLUMNS],
+    fetch=(fetch_efectos_range, "categoria"),
+    dataset=("efectos_categoria", ["fecha", "categoria"] + EFECTOS_COLUMNS),
+))
+
+sub_report_efec_subcategoria = table_section(TableSpec(
+    name="efec_subcategoria",
+    label="Efectos Subcategoria",
+    title="EFECTOS DE SUSCRIPCION NETOS POR SUBCATEGORIA (en millones):",
+    columns=[("SUB-CATEGORIA", 161, None)] + [(header, 50, format_thousands) for header in EFECTOS_COLUMNS],
+    fetch=(fetch_efectos_range, "subcategoria"),
+    dataset=("efectos_subcategoria", ["fecha", "subcategoria"] + EFECTOS_COLUMNS),
+))
+
+# Gerente amounts keep 2 decimals
+sub_report_efec_gerente = table_section(TableSpec(
+    name="efec_gerente",
+    label="Efectos Gerente",
+    title="EFECTOS DE SUSCRIPCION NETOS POR GERENTE (en millones):",
+    columns=[("GERENTE", 165, None)] + [(header, 50, partial(format_thousands, decimals=2))
+                                        for header in EFECTOS_COLUMNS],
+    fetch=(fetch_efectos_range, "gerente"),
+    dataset=("efectos_gerente", ["fecha", "gerente"] + EFECTOS_COLUMNS),
+))
+
+sub_report_rentabilidades = table_section(TableSpec(
+    name="rentabilidades",
+    label="Rentabilidades",
+    title="RENTABILIDADES VCP (en %):",
+    columns=[("FONDO", 127, None), ("PATRIMONIO", 60, format_thousands), ("CATEGORIA", 60, None),
+             ("SUBCATEGORIA", 60, None)]
+            + [(header, 35, format_percent) for header in ["1D", "WTD", "MTD", "1M", "3M", "YTD", "1Y"]],
+    query=RENTABILIDADES_QUERY,
+    sources=RENTABILIDADES_SOURCES,
+    style="compact",
+    paginate=True,
+    dataset=("rentabilidades", ["fecha", "fondo", "patrimonio", "categoria", "subcategoria",
+                                "1D", "WTD", "MTD", "1M", "3M", "YTD", "1Y"]),
+))
+
+sub_report_fondos_sin_clasificar = table_section(TableSpec(
+    name="fondos_sin_clasificar",
+    label="Fondos Sin Clasificar",
+    title="FONDOS SIN CLASIFICAR:",
+    columns=[("FONDO", 225, None)],
+    fetch=(fetch_fondos_sin_clasificar_range, None),
+    skip=0,
+    style="compact",
+    dataset=("fondos_sin_clasificar", ["fondo"]),
+))
+
+TABLE_SECTIONS = [
+    sub_report_efec_categoria,
+    sub_report_efec_subcategoria,
+    sub_report_efec_gerente,
+    sub_report_rentabilidades,
+    sub_report_fondos_sin_clasificar,
+]
+
+# Data fetchers for every sub-report that queries the database, as (fetcher, slice).
+# Sections sharing a fetcher are served by a single call, each taking its own slice.
+# Fetchers take a list of report dates and return {report_date: data}.
+SECTION_FETCHERS = {
+    sub_report_summary: (fetch_summary_range, None),
+    **{section: section.spec.fetch for section in TABLE_SECTIONS},
+}
+
+# Every table or view a cached query reads; install_change_log puts the trigger on them
+CACHE_SOURCES = tuple(sorted(set(
+    EFECTOS_SOURCES + DAILY_TOTALS_SOURCES + SUMMARY_AUM_SOURCES + SUMMARY_SUBSCRIPTIONS_SOURCES
+    + RENTABILIDADES_SOURCES + FONDOS_SIN_CLASIFICAR_SOURCES + KNOWN_FUNDS_SOURCES + REPORT_DATE_SOURCES)))
+
+# Async versions of the fetchers, used by fetch_sections_range_async
+ASYNC_FETCHERS = {
+    fetch_summary_range: fetch_summary_range_async,
+    fetch_efectos_range: fetch_efectos_range_async,
+    fetch_fondos_sin_clasificar_range: fetch_fondos_sin_clasificar_range_async,
+    **{section.spec.fetch[0]: section.fetch_async for section in TABLE_SECTIONS if section.fetch_async},
+}
+
+DEFAULT_SUB_REPORTS = [
+    sub_report_cover,               # Page 0: Portada
+    sub_report_summary,            # Page 1: RESUMEN DE AUM POR FECHA
+    sub_report_efec_categoria,     # Page 2: EFECTOS POR CATEGORIA
+    sub_report_efec_subcategoria,  # Page 3: EFECTOS POR SUB-CATEGORIA
+    sub_report_efec_gerente,       # Page 4: EFECTOS POR GERENTE
+    sub_report_rentabilidades,     # Page 5: RENTABILIDADES VCP
+    sub_report_fondos_sin_clasificar # Page 6: FONDOS SIN CLASIFICAR
+]
+
+# Sections by short name (e.g. "rentabilidades"), for callers that pick sections by name
+SUB_REPORTS_BY_NAME = {func.__name__.replace('sub_report_', ''): func for func in DEFAULT_SUB_REPORTS}
+
+# Tables behind each section for the exports: (dataset, columns, index into the section
+# data or None for the data itself)
+SECTION_DATASETS = {
+    sub_report_summary: [("aum", ["fecha", "total_aum"], 0),
+                         ("suscripciones", ["fecha", "suscripciones"], 1)],
+    **{section: [section.spec.dataset + (None,)] for section in TABLE_SECTIONS if section.spec.dataset},
+}
+
+def section_datasets(sub_report_functions, section_data):
+    """Yields (dataset, columns, rows) for every exportable section whose data was fetched."""
+    for func in sub_report_functions:
+        data = section_data.get(func)
+        if func not in SECTION_DATASETS or data is None or isinstance(data, Exception):
+            continue
+        for name, columns, index in SECTION_DATASETS[func]:
+            yield name, columns, data if index is None else data[index]
+
+def export_filename(output_file, fmt, dataset=None):
+    """File for an export next to output_file: one per dataset, or one workbook."""
+    base = os.path.splitext(output_file)[0]
+    return f"{base} {dataset}.{fmt}" if dataset else f"{base}.{fmt}"
+
+def _write_csv(output_file, datasets):
+    paths = []
+    for name, columns, rows in datasets:
+        path = export_filename(output_file, "csv", name)
+        with open(path, "w", newline="", encoding="utf-8") as file:
+            writer = csv.writer(file)
+            writer.writerow(columns)
+            writer.writerows(rows)
+        paths.append(path)
+    return paths
+
+def _write_xlsx(output_file, datasets):
+    from openpyxl import Workbook
+
+    # Write-only workbooks stream rows to disk instead of keeping every cell object
+    workbook = Workbook(write_only=True)
+    for name, columns, rows in datasets:
+        sheet = workbook.create_sheet(title=name[:31])
+        sheet.append(columns)
+        for row in rows:
+            sheet.append(row)
+    path = export_filename(output_file, "xlsx")
+    workbook.save(path)
+    return [path]
+
+def _arrow_type(pa, values):
+    """Arrow type for a column, from its first non-null value (numerics as float64)."""
+    for value in values:
+        if value is None:
+            continue
+        if isinstance(value, bool):
+            return pa.bool_()
+        if isinstance(value, int):
+            return pa.int64()
+        if isinstance(value, (float, Decimal)):
+            return pa.float64()
+        if isinstance(value, datetime):
+            return pa.timestamp("us")
+        if isinstance(value, date):
+            return pa.date32()
+        return pa.string()
+    return pa.string()
+
+def _write_parquet(output_file, datasets):
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    paths = []
+    for name, columns, rows in datasets:
+        types = [_arrow_type(pa, (row[i] for row in rows)) for i in range(len(columns))]
+        schema = pa.schema(list(zip(columns, types)))
+        path = export_filename(output_file, "parquet", name)
+        # One record batch per CHUNK_ROWS rows, so no full columnar copy is built
+        with pq.ParquetWriter(path, schema) as writer:
+            for start in range(0, len(rows), CHUNK_ROWS):
+                batch = rows[start:start + CHUNK_ROWS]
+                arrays = []
+                for i, arrow_type in enumerate(types):
+                    values = [row[i] for row in batch]
+                    if arrow_type == pa.float64():
+                        values = [None if value is None else float(value) for value in values]
+                    arrays.append(pa.array(values, type=arrow_type))
+                writer.write_batch(pa.record_batch(arrays, schema=schema))
+        paths.append(path)
+    return paths
+
+EXPORT_WRITERS = {"csv": _write_csv, "xlsx": _write_xlsx, "parquet": _write_parquet}
+
+def export_datasets(output_file, datasets, formats):
+    """Writes datasets (as from section_datasets) next to output_file in each format.
+
+    Returns the files written. A format whose library (openpyxl, pyarrow) is missing, or
+    whose writer fails, is skipped with a message.
+    """
+    datasets = list(datasets)
+    paths = []
+    for fmt in formats:
+        try:
+            paths += EXPORT_WRITERS[fmt](output_file, datasets)
+        except ImportError as e:
+            print(f"Export: {fmt} needs {e.name}, which is not installed; skipping")
+        except Exception as e:
+            print(f"Export: could not write {fmt}: {str(e)}")
+    return paths
 
-def sub_report_fondos_sin_clasificar(report_date):
-    """Generates a sub-report with funds without classification."""
-    elements = []
-    styles = getSampleStyleSheet()
+def report_filename(report_date):
+    """Output PDF name for a report date."""
+    return f"{report_date.replace('-', '')} reporte fci.pdf"
 
-    # Query database for funds without classification
-    with engine.connect() as connection:
+def get_report_dates(date_from, date_to):
+    """Dates with data in fci_diaria_2 between date_from and date_to (inclusive)."""
+    with get_engine().connect() as connection:
         query = text("""
-            SELECT DISTINCT f.fondo
-            FROM fci_diaria_2 f
-            LEFT JOIN "clasesFCI" c
-                ON f.fondo = c.fondo
-            WHERE c.fondo IS NULL
-                OR c.familia IS NULL
-                OR c.categoria IS NULL
-                OR c."subCategoria" IS NULL;
+            SELECT DISTINCT fecha_imputada
+            FROM fci_diaria_2
+            WHERE fecha_imputada BETWEEN :date_from AND :date_to
+            ORDER BY fecha_imputada
         """)
-        result = connection.execute(query)
-        data = result.fetchall()
-
-    if not data:
-        elements.append(Paragraph("No data available for Fondos Sin Clasificar report.", styles['Normal']))
-        elements.append(PageBreak())
-        return elements
-
-    # Title
-    title = Paragraph("FONDOS SIN CLASIFICAR:", styles['Heading2'])
-    elements.append(title)
-    elements.append(Spacer(1, 10))
-    elements.append(Paragraph(f"Fecha: {report_date}", styles['Normal']))
-    elements.append(Spacer(1, 5))
-
-    # Table (excluding fecha_imputada)
-    table_data = [["FONDO"]]
-    for row in data:
-        table_data.append([
-            row[0],  # fondo -> FONDO
-        ])
-    
-    table = Table(table_data, colWidths=[225], hAlign='LEFT', repeatRows=1)
-    table.setStyle(TableStyle([
-        ('BACKGROUND', (0, 0), (-1, 0), colors.grey),
-        ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
-        ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
-        ('FONTNAME', (0, 0), (-1, -1), 'MS Sans Serif'),
-        ('FONTSIZE', (0, 0), (-1, -1), 6),     # achicamos la fuente
-        ('LEADING', (0, 0), (-1, -1), 6),      # achicamos interlineado
-        ('TOPPADDING', (0,0), (-1,-1), 0.5),     # sin espacio arriba
-        ('BOTTOMPADDING', (0,0), (-1,-1), 0.6),  # sin espacio abajo
-        ('GRID', (0, 0), (-1, -1), 0.25, colors.black),
-        ('BOX', (0, 0), (-1, -1), 1, colors.black),
-    ]))
+        result = connection.execute(query, {"date_from": date_from, "date_to": date_to})
+        return [row[0].isoformat() for row in result]
+
+def _render_batch_date(report_date, sub_report_functions, section_data, export_formats=None):
+    """Renders one date of a batch run (module level so process pools can pickle it)."""
+    output_file = report_filename(report_date)
+    if not generate_multi_report_pdf(output_file, sub_report_functions, report_date, section_data,
+                                     export_formats=export_formats):
+        raise RuntimeError(f"PDF not generated: {output_file}")
+    return output_file
+
+def generate_report_batch(date_from, date_to, sub_report_functions=None, workers=1, export_formats=None):
+    """Renders the report for every date between date_from and date_to in one process.
+
+    Section data for the whole range is fetched once with range queries; each date's PDF
+    is then rendered, optionally across a pool of worker processes.
+    """
+    sub_report_functions = sub_report_functions or DEFAULT_SUB_REPORTS
+    report_dates = get_report_dates(date_from, date_to)
+    if not report_dates:
+        print(f"No report dates between {date_from} and {date_to}.")
+        return []
+    print(f"Batch: {len(report_dates)} dates between {report_dates[0]} and {report_dates[-1]}")
+
+    start = time.perf_counter()
+    metrics = RunMetrics(f"{report_dates[0]}..{report_dates[-1]}")
+    section_data = fetch_sections_range(sub_report_functions, report_dates, metrics=metrics)
+
+    output_files = []
+    if workers > 1:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            futures = {
+                executor.submit(_render_batch_date, d, sub_report_functions, section_data.pop(d), export_formats): d
+                for d in report_dates
+            }
+            for future in as_completed(futures):
+                try:
+                    output_files.append(future.result())
+                except Exception as e:
+                    print(f"Error rendering report for {futures[future]}: {str(e)}")
+    else:
+        for d in report_dates:
+            try:
+                output_files.append(_render_batch_date(d, sub_report_functions, section_data.pop(d), export_formats))
+            except Exception as e:
+                print(f"Error rendering report for {d}: {str(e)}")
 
-    elements.append(table)
-    elements.append(PageBreak())
+    print(f"Batch: {len(output_files)} reports generated in {time.perf_counter() - start:.2f}s")
+    metrics.set(dates=len(report_dates), reports=len(output_files), total_s=time.perf_counter() - start)
+    try:
+        first, last = report_dates[0].replace('-', ''), report_dates[-1].replace('-', '')
+        metrics.write_jsonl(f"{first}-{last} reporte fci batch.metrics.jsonl")
+    except Exception as e:
+        print(f"Could not write batch metrics: {str(e)}")
+    return sorted(output_files)
 
-    print("Fondos Sin Clasificar: Table added")
-    return elements  
-
-def main():
-    report_date = get_report_date()
-    output_file = f"{report_date.replace('-', '')} reporte fci.pdf"
-    sub_reports = [
-        sub_report_cover,               # Page 0: Portada
-        sub_report_summary,            # Page 1: RESUMEN DE AUM POR FECHA
-        sub_report_efec_categoria,     # Page 2: EFECTOS POR CATEGORIA
-        sub_report_efec_subcategoria,  # Page 3: EFECTOS POR SUB-CATEGORIA
-        sub_report_efec_gerente,       # Page 4: EFECTOS POR GERENTE
-        sub_report_rentabilidades,     # Page 5: RENTABILIDADES VCP
-        sub_report_fondos_sin_clasificar # Page 6: FONDOS SIN CLASIFICAR
-    ]
-    generate_multi_report_pdf(output_file, sub_reports, report_date)
+def _iso_date(value):
+    """argparse type for YYYY-MM-DD dates."""
+    try:
+        return datetime.strptime(value, '%Y-%m-%d').date().isoformat()
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"fecha inválida '{value}', se espera YYYY-MM-DD")
+
+def _export_formats(value):
+    """argparse type for a comma-separated list of export formats."""
+    formats = [f.strip() for f in value.split(",") if f.strip()]
+    unknown = [f for f in formats if f not in EXPORT_WRITERS]
+    if unknown:
+        raise argparse.ArgumentTypeError(f"formato desconocido: {', '.join(unknown)} (disponibles: {', '.join(EXPORT_WRITERS)})")
+    return formats
+
+def parse_args(argv=None):
+    """Parses the command line."""
+    parser = argparse.ArgumentParser(description="Genera el reporte de la industria FCI en PDF.")
+    parser.add_argument("report_date", nargs="?", help="Fecha del reporte (YYYY-MM-DD). Por defecto, la última disponible.")
+    parser.add_argument("--from", dest="date_from", type=_iso_date, help="Modo batch: primera fecha a generar (YYYY-MM-DD).")
+    parser.add_argument("--to", dest="date_to", help="Modo batch: última fecha a generar (YYYY-MM-DD). Por defecto, la última disponible.")
+    parser.add_argument("--workers", type=int, default=1, help="Modo batch: procesos para renderizar las fechas en paralelo.")
+    parser.add_argument("--render-workers", type=int, default=RENDER_WORKERS, help="Procesos para armar las secciones del PDF en paralelo.")
+    parser.add_argument("--export", type=_export_formats, default=EXPORT_FORMATS, metavar="FORMATOS", help="Exportar también los datos de cada sección: csv, xlsx y/o parquet, separados por coma.")
+    parser.add_argument("--async-db", action="store_true", help="Consultas y procedimientos sobre el motor asíncrono (asyncpg).")
+    parser.add_argument("--no-cache", action="store_true", help="No usar la caché de resultados de las consultas.")
+    parser.add_argument("--procedures", metavar="ARCHIVO", help="Ejecutar los procedimientos del archivo antes del reporte (admite 'nombre: dep1, dep2'; las líneas sin ':' siguen a la anterior).")
+    parser.add_argument("--procedure-workers", type=int, default=PROCEDURE_WORKERS, help="Procedimientos a ejecutar en paralelo.")
+    parser.add_argument("--refresh-tables", action="store_true", help="Instalar el registro de cambios de la caché y actualizar las tablas propias del reporte (fecha, fondos conocidos, totales diarios).")
+    parser.add_argument("--no-report", action="store_true", help="No generar el reporte (por ejemplo, solo ejecutar procedimientos).")
+    parser.add_argument("--print-date", action="store_true", help="Solo mostrar la fecha del reporte y salir.")
+    parser.add_argument("--startup-profile", action="store_true", help="Mostrar el costo de imports e inicialización al terminar.")
+    return parser.parse_args(argv)
+
+def main(argv=None):
+    global CACHE_ENABLED, ASYNC_DB
+    args = parse_args(argv)
+    if args.no_cache:
+        CACHE_ENABLED = False
+    if args.async_db:
+        ASYNC_DB = True
+    try:
+        if args.procedures:
+            results = run_procedures(args.procedures, args.procedure_workers)
+            failed = [name for name, (status, _) in results.items() if status != "ok"]
+            if failed:
+                print(f"Reporte no generado: {len(failed)} procedimientos fallaron o se omitieron.")
+                sys.exit(1)
+        if args.refresh_tables:
+            refresh_report_tables()
+        if args.no_report:
+            return
+        if args.print_date:
+            print(get_report_date(args.report_date))
+        elif args.date_from:
+            date_to = get_report_date(args.date_to)
+            generate_report_batch(args.date_from, date_to, workers=args.workers, export_formats=args.export)
+        else:
+            report_date = get_report_date(args.report_date)
+            output_file = report_filename(report_date)
+            generate_multi_report_pdf(output_file, DEFAULT_SUB_REPORTS, report_date, render_workers=args.render_workers,
+                                      export_formats=args.export)
+    finally:
+        if args.startup_profile:
+            print_startup_profile()
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
@@ -215,8 +215,8 @@ def sub_report_summary(report_date):
         plt.grid(True, linestyle='--', alpha=0.7, axis='y')  # Grid only on y-axis
         plt.tight_layout()
 
-        # Save to temp directory
-        temp_dir = tempfile.gettempdir()
+        # Save to a private temp directory for this run, so concurrent runs don't share the file
+        temp_dir = tempfile.mkdtemp(prefix="reporte_aum_")
         chart_path = os.path.join(temp_dir, "temp_chart.png")
         plt.savefig(chart_path, dpi=100, bbox_inches='tight')
         plt.close()
@@ -292,6 +292,7 @@ def generate_multi_report_pdf(output_file, sub_report_functions, report_date):
         if os.path.exists(path):
             try:
                 os.remove(path)
+                os.rmdir(os.path.dirname(path))  # Per-run chart directory
                 print(f"Cleaned up: {path}")
             except Exception as e:
                 print(f"Failed to clean up {path}: {str(e)}")
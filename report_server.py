@@ -0,0 +1,242 @@
+"""Long-lived report server: keeps report.py's engine, fonts, matplotlib and caches warm.
+
+Serves a small local HTTP API, over TCP or a Unix socket:
+
+    GET /report?date=YYYY-MM-DD&sections=summary,rentabilidades&format=pdf
+        Renders the report and streams it back. date defaults to the latest available,
+        sections to the full report (names as in report.SUB_REPORTS_BY_NAME). format=xlsx
+        returns the sections' data as a workbook; csv and parquet, a zip with one file per
+        dataset.
+    GET /date      Latest report date.
+    GET /health    Uptime and number of reports served.
+
+    python report_server.py --port 8765
+    python report_server.py --unix /run/reporte_fci.sock
+    curl --unix-socket /run/reporte_fci.sock "http://localhost/report?date=2025-03-13" -o reporte.pdf
+"""
+import os
+import json
+import time
+import socket
+import argparse
+import tempfile
+import zipfile
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from socketserver import ThreadingMixIn, UnixStreamServer
+from urllib.parse import urlparse, parse_qs
+
+import report
+
+FORMATS = {
+    "pdf": "application/pdf",
+    "xlsx": "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+    "csv": "application/zip",
+    "parquet": "application/zip",
+}
+STREAM_CHUNK = 64 * 1024
+
+# pyplot and reportlab keep module-level state, so layouts run one at a time; the
+# section queries of concurrent requests still overlap, up to MAX_FETCHES at once.
+_render_lock = threading.Lock()
+_started_at = time.time()
+_served = 0
+_served_lock = threading.Lock()
+
+MAX_FETCHES = int(os.environ.get('REPORT_SERVER_FETCHES', '4'))
+# Connections a request holds while fetching: one per fetch worker (the first being the
+# snapshot leader) and one for short lookups (report date)
+CONNECTIONS_PER_FETCH = report.FETCH_WORKERS + 1
+_fetch_slots = threading.BoundedSemaphore(MAX_FETCHES)
+
+def fetch(sub_report_functions, report_date):
+    """Fetches the sections' data, waiting for a slot so the engine pool is never exhausted."""
+    with _fetch_slots:
+        return report.fetch_sections_data(sub_report_functions, report_date)
+
+def warm_up():
+    """Pays the cold-start costs once: fonts, matplotlib, the engine and a first connection."""
+    start = time.perf_counter()
+    report.register_fonts()
+    report.load_pyplot()
+    try:
+        import pypdf  # noqa: F401  (used to merge section fragments)
+    except ImportError:
+        pass
+    try:
+        with report.get_engine().connect() as connection:
+            connection.exec_driver_sql("SELECT 1")
+    except Exception as e:
+        print(f"Server: could not connect to the database yet: {str(e)}")
+    print(f"Server: warmed up in {time.perf_counter() - start:.2f}s")
+
+def parse_sections(value):
+    """Section functions for a comma-separated list of names, in report order."""
+    if not value:
+        return report.DEFAULT_SUB_REPORTS
+    names = [name.strip() for name in value.split(",") if name.strip()]
+    unknown = [name for name in names if name not in report.SUB_REPORTS_BY_NAME]
+    if unknown:
+        raise ValueError(f"Unknown sections: {', '.join(unknown)}. "
+                         f"Available: {', '.join(report.SUB_REPORTS_BY_NAME)}")
+    return [func for name, func in report.SUB_REPORTS_BY_NAME.items() if name in names]
+
+def render(report_date, sub_report_functions, output_file):
+    """Fetches concurrently with other requests, then lays out under the render lock.
+
+    Layout stays in this process: forking render workers from a multi-threaded server
+    could copy a lock another thread holds and hang the child.
+    """
+    section_data = fetch(sub_report_functions, report_date)
+    with _render_lock:
+        return report.generate_multi_report_pdf(output_file, sub_report_functions, report_date, section_data,
+                                                render_workers=1, export_formats=[])
+
+def export(report_date, sub_report_functions, fmt, output_dir):
+    """Writes the sections' datasets in fmt from a fresh fetch; no layout, so no lock.
+
+    Returns the file to send (the workbook, or a zip of the per-dataset files) or None.
+    """
+    section_data = fetch(sub_report_functions, report_date)
+    base = os.path.join(output_dir, report.report_filename(report_date))
+    paths = report.export_datasets(base, report.section_datasets(sub_report_functions, section_data), [fmt])
+    if not paths:
+        return None
+    if fmt == "xlsx":
+        return paths[0]
+    archive = report.export_filename(base, "zip", fmt)
+    # Parquet pages are compressed already
+    compression = zipfile.ZIP_STORED if fmt == "parquet" else zipfile.ZIP_DEFLATED
+    with zipfile.ZipFile(archive, "w", compression) as zf:
+        for path in paths:
+            zf.write(path, os.path.basename(path))
+    return archive
+
+class ReportRequestHandler(BaseHTTPRequestHandler):
+    server_version = "ReporteFCI/1.0"
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        query = {key: values[-1] for key, values in parse_qs(url.query).items()}
+        try:
+            if url.path == "/health":
+                self._send_json(200, {"status": "ok", "uptime_s": round(time.time() - _started_at), "served": _served})
+            elif url.path == "/date":
+                self._send_json(200, {"report_date": report.get_report_date()})
+            elif url.path == "/report":
+                self._send_report(query)
+            else:
+                self._send_json(404, {"error": f"Unknown path {url.path}"})
+        except BrokenPipeError:
+            print("Server: client disconnected")
+        except Exception as e:
+            print(f"Server: error handling {self.path}: {str(e)}")
+            self._send_json(500, {"error": str(e)})
+
+    def _send_report(self, query):
+        global _served
+        fmt = query.get("format", "pdf")
+        if fmt not in FORMATS:
+            self._send_json(400, {"error": f"Unsupported format '{fmt}'. Available: {', '.join(FORMATS)}"})
+            return
+        try:
+            sub_report_functions = parse_sections(query.get("sections"))
+            report_date = report._iso_date(query["date"]) if query.get("date") else report.get_report_date()
+        except (ValueError, argparse.ArgumentTypeError) as e:
+            self._send_json(400, {"error": str(e)})
+            return
+
+        start = time.perf_counter()
+        with tempfile.TemporaryDirectory(prefix="reporte_fci_server_") as out_dir:
+            if fmt == "pdf":
+                output_file = os.path.join(out_dir, report.report_filename(report_date))
+                if not render(report_date, sub_report_functions, output_file):
+                    output_file = None
+            else:
+                output_file = export(report_date, sub_report_functions, fmt, out_dir)
+            if output_file is None:
+                self._send_json(500, {"error": f"Report for {report_date} could not be generated as {fmt}"})
+                return
+            elapsed = time.perf_counter() - start
+            self.send_response(200)
+            self.send_header("Content-Type", FORMATS[fmt])
+            self.send_header("Content-Length", str(os.path.getsize(output_file)))
+            self.send_header("Content-Disposition", f'attachment; filename="{os.path.basename(output_file)}"')
+            self.send_header("X-Report-Date", report_date)
+            self.send_header("X-Render-Seconds", f"{elapsed:.3f}")
+            self.end_headers()
+            with open(output_file, "rb") as file:
+                while True:
+                    chunk = file.read(STREAM_CHUNK)
+                    if not chunk:
+                        break
+                    self.wfile.write(chunk)
+        with _served_lock:
+            _served += 1
+        print(f"Server: served {report_date} as {fmt} ({len(sub_report_functions)} sections) in {elapsed:.2f}s")
+
+    def _send_json(self, status, payload):
+        body = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def address_string(self):
+        # Unix socket peers have no address
+        return self.client_address[0] if isinstance(self.client_address, tuple) else "unix"
+
+    def log_message(self, format, *args):
+        print(f"Server: {self.address_string()} {format % args}")
+
+class ThreadingUnixHTTPServer(ThreadingMixIn, UnixStreamServer):
+    daemon_threads = True
+
+    def server_bind(self):
+        UnixStreamServer.server_bind(self)
+        # BaseHTTPRequestHandler expects these from HTTPServer
+        self.server_name, self.server_port = socket.gethostname(), 0
+
+def make_server(host="127.0.0.1", port=8765, unix_socket=None):
+    if unix_socket:
+        if os.path.exists(unix_socket):
+            os.remove(unix_socket)
+        return ThreadingUnixHTTPServer(unix_socket, ReportRequestHandler)
+    return ThreadingHTTPServer((host, port), ReportRequestHandler)
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Servidor local del reporte FCI (mantiene conexiones, fuentes y cachés en memoria).")
+    parser.add_argument("--host", default="127.0.0.1", help="Dirección donde escuchar.")
+    parser.add_argument("--port", type=int, default=8765, help="Puerto TCP.")
+    parser.add_argument("--unix", metavar="SOCKET", help="Escuchar en un socket Unix en lugar de TCP.")
+    parser.add_argument("--async-db", action="store_true", help="Consultas sobre el motor asíncrono (asyncpg).")
+    parser.add_argument("--max-fetches", type=int, default=MAX_FETCHES,
+                        help="Máximo de pedidos consultando la base a la vez (el pool de conexiones se ajusta a esto).")
+    parser.add_argument("--no-cache", action="store_true", help="No usar la caché de resultados de las consultas.")
+    return parser.parse_args(argv)
+
+def main(argv=None):
+    global _fetch_slots
+    args = parse_args(argv)
+    _fetch_slots = threading.BoundedSemaphore(max(1, args.max_fetches))
+    # Set before warm_up creates the engine
+    report.DB_POOL_SIZE = max(report.DB_POOL_SIZE, args.max_fetches * CONNECTIONS_PER_FETCH)
+    if args.no_cache:
+        report.CACHE_ENABLED = False
+    if args.async_db:
+        report.ASYNC_DB = True
+    warm_up()
+    server = make_server(args.host, args.port, args.unix)
+    print(f"Server: listening on {args.unix or f'http://{args.host}:{args.port}'}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        print("Server: stopping")
+    finally:
+        server.server_close()
+        if args.unix and os.path.exists(args.unix):
+            os.remove(args.unix)
+
+if __name__ == "__main__":
+    main()